@@ -0,0 +1,81 @@
+'''
+How many fetches the canonical urls of utils/canonical_url.py save: the
+urls of a recorded crawl are counted once under the previous normalize and
+url hash and once under the canonical key, and the difference is the number
+of pages that were fetched, parsed and counted more than once.
+
+    python -m benchmarks.canonical [urls.txt | frontier.db]
+
+The corpus is a text file with one url per line or a sqlite frontier save
+file (the urls the crawl queued); without it a synthetic corpus of
+spellings of the same pages is used.
+'''
+import sys
+import time
+import random
+
+from hashlib import sha256
+from urllib.parse import urlparse
+
+import scraper
+from utils import get_urldigest, normalize
+from utils.canonical_url import canonicalize, canonical_key
+from benchmarks.url_filter import load_corpus
+
+def legacy_normalize(url):
+    # normalize before utils/canonical_url.py
+    if url.endswith("/"):
+        return url.rstrip("/")
+    return url
+
+def legacy_urldigest(url):
+    # get_urldigest before utils/canonical_url.py
+    parsed = urlparse(url)
+    return sha256(
+        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
+        f"{parsed.query}/{parsed.fragment}".encode("utf-8")).digest()
+
+def synthetic_corpus(count=100000, seed=0):
+    rng = random.Random(seed)
+    hosts = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu", "vision.ics.uci.edu"]
+    paths = ["", "/about", "/people", "/research/areas", "/courses/cs121", "/news/story-123"]
+    queries = [(), (("page", "2"),), (("page", "2"), ("lang", "en"))]
+
+    def spelling(host, path, query):
+        host = rng.choice([host, "www." + host, "WWW." + host.upper()])
+        port = rng.choice(["", "", ":443"])
+        path = rng.choice([path, path + "/", path + "/index.html", path.replace("a", "%61")])
+        query = list(query)
+        rng.shuffle(query)
+        query = "?" + "&".join(f"{key}={value}" for key, value in query) if query else ""
+        fragment = rng.choice(["", "", "#content"])
+        return f"https://{host}{port}{path}{query}{fragment}"
+
+    pages = [(rng.choice(hosts), rng.choice(paths) + f"/{n}", rng.choice(queries)) for n in range(count // 10)]
+    return [spelling(*rng.choice(pages)) for _ in range(count)]
+
+def main(path=None):
+    urls = load_corpus(path) if path else synthetic_corpus()
+
+    # Pages the crawler would have fetched: before, the links were filtered
+    # as they came; now they are canonicalized first (so WWW.ICS.UCI.EDU:443
+    # passes the domain check) and filtered after.
+    start = time.perf_counter()
+    legacy = {legacy_urldigest(legacy_normalize(url)) for url in scraper.filter_urls(urls)}
+    legacy_time = time.perf_counter() - start
+
+    canonicalize.cache_clear()
+    canonical_key.cache_clear()
+    start = time.perf_counter()
+    canonical_urls = scraper.filter_urls(list(dict.fromkeys(map(canonicalize, urls))))
+    canonical = {get_urldigest(normalize(url)) for url in canonical_urls}
+    canonical_time = time.perf_counter() - start
+
+    saved = len(legacy) - len(canonical)
+    print(f"{len(urls)} urls")
+    print(f"    legacy hash: {len(legacy):8} distinct pages, {len(urls) / legacy_time:10.0f} urls/sec")
+    print(f"  canonical key: {len(canonical):8} distinct pages, {len(urls) / canonical_time:10.0f} urls/sec")
+    print(f"  fetches saved: {saved:8} ({100 * saved / max(len(legacy), 1):.1f}% of the crawl)")
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,178 @@
+'''
+End-to-end crawl benchmark against the local mock cache server
+(utils/mock_server.py). For every engine, thread count and frontier setting
+it reports fetches per second, p50/p99 fetch latency, CPU seconds and the
+peak RSS of the crawler.
+
+    python -m benchmarks.crawl [--engines threaded,async] [--threads 1,4,16]
+        [--frontiers sqlite,shelve,spill,fifo] [--hosts 20] [--site_size 50]
+        [--latency 0.02] [--error_rate 0.01] [--politeness 0.01] [--corpus dir]
+        [--metrics] [--url_log_rate 0.1]
+
+Each configuration crawls from scratch in its own process and temporary
+directory, so the CPU time and peak RSS are the crawler's alone. The mock
+server runs in this process. --metrics runs the crawls with the
+instrumentation of utils/metrics.py enabled, to measure its overhead.
+After each crawl the child also times one per-url log line from the worker
+threads, through the queued loggers of utils/log_queue.py ("log us") and
+through a synchronous file and console handler like the ones get_logger
+used to attach ("sync log us").
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+
+from argparse import ArgumentParser, SUPPRESS
+from configparser import ConfigParser
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# config.ini overrides of every frontier setting, by section
+frontier_settings = {
+    "sqlite": {"LOCAL PROPERTIES": {"SAVEBACKEND": "sqlite"}},
+    "shelve": {"LOCAL PROPERTIES": {"SAVEBACKEND": "shelve"}},
+    "spill": {"LOCAL PROPERTIES": {"MAXQUEUEDURLS": "200", "SPILLSEGMENTSIZE": "100"}},
+    "fifo": {"CRAWLER": {"SCORERS": ""}},
+}
+
+def log_call_seconds(logger, threads=4, calls=5000):
+    # Average time of one per-url INFO line logged from several threads at once
+    def log_lines():
+        for n in range(calls):
+            logger.info(f"Downloaded https://www.ics.uci.edu/{n}, status <200>, "
+                        f"using cache ('127.0.0.1', 8000).")
+    workers = [threading.Thread(target=log_lines) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (threads * calls)
+
+def sync_logger():
+    # What get_logger attached before utils/log_queue.py
+    logger = logging.getLogger("BenchmarkSync")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    os.makedirs("Logs", exist_ok=True)
+    for handler in (logging.FileHandler("Logs/BenchmarkSync.log"), logging.StreamHandler()):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
+
+def run_crawl(settings):
+    # Runs in the child process: one crawl with the given settings.
+    import resource
+    from utils.config import Config
+    from utils import get_logger
+    from utils.download import download_stats
+    from utils.log_queue import log_pipeline
+    from crawler import Crawler
+    from crawler.async_engine import AsyncCrawler
+
+    work_dir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(repo_dir, "english_stopwords.txt"), work_dir)
+    os.chdir(work_dir)
+    cparser = ConfigParser()
+    cparser.read(os.path.join(repo_dir, "config.ini"))
+    overrides = {
+        "CRAWLER": {"SEEDURL": ",".join(settings["seed_urls"]),
+                    "POLITENESS": str(settings["politeness"])},
+        "LOCAL PROPERTIES": {"THREADCOUNT": str(settings["threads"]),
+                             "ENGINE": settings["engine"]},
+        "METRICS": {"ENABLED": str(settings["metrics"])},
+    }
+    if settings["url_log_rate"] is not None:
+        overrides["LOGGING"] = {"URLSAMPLERATE": str(settings["url_log_rate"])}
+    for section_overrides in (overrides, frontier_settings[settings["frontier"]]):
+        for section, options in section_overrides.items():
+            for option, value in options.items():
+                cparser[section][option] = value
+    config = Config(cparser)
+    config.cache_server = tuple(settings["cache_server"])
+
+    crawler_class = AsyncCrawler if config.engine == "async" else Crawler
+    start = time.perf_counter()
+    crawler = crawler_class(config, True)
+    crawler.start()
+    elapsed = time.perf_counter() - start
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    summary = download_stats.summary()
+    log_seconds = log_call_seconds(get_logger("Worker-0", "Worker"))
+    sync_log_seconds = log_call_seconds(sync_logger())
+    log_pipeline.stop()
+    os.chdir(repo_dir)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "pages": crawler.crawl_stats.stats["total_pages"],
+        "fetches": summary["requests"],
+        "seconds": elapsed,
+        "p50_seconds": summary["p50_seconds"],
+        "p99_seconds": summary["p99_seconds"],
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        "peak_rss_mb": usage.ru_maxrss / 1024,   # ru_maxrss is in KB on Linux
+        "log_seconds": log_seconds,
+        "sync_log_seconds": sync_log_seconds,
+    }
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--engines", type=str, default="threaded,async")
+    parser.add_argument("--threads", type=str, default="1,4,16")
+    parser.add_argument("--frontiers", type=str, default="sqlite")
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--site_size", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error_rate", type=float, default=0.01)
+    parser.add_argument("--politeness", type=float, default=0.01)
+    parser.add_argument("--corpus", type=str, default=None)
+    parser.add_argument("--metrics", action="store_true", default=False)
+    parser.add_argument("--url_log_rate", type=float, default=None)
+    parser.add_argument("--child", type=str, default=None, help=SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_crawl(json.loads(args.child))))
+        return
+
+    from utils.mock_server import MockCacheServer, SyntheticSite, CorpusSite
+    site = CorpusSite(args.corpus) if args.corpus else SyntheticSite(args.hosts, args.site_size)
+    server = MockCacheServer(site, 0, args.latency, args.error_rate).start()
+    print(f"Mock cache server: latency {args.latency}s, error rate {args.error_rate}, "
+          f"politeness {args.politeness}s, {len(site.seed_urls())} seed urls")
+    print(f"{'engine':>8} {'threads':>7} {'frontier':>8} {'pages':>6} {'fetches/s':>9} "
+          f"{'p50 ms':>7} {'p99 ms':>7} {'cpu s':>6} {'rss MB':>7} {'log us':>6} {'sync log us':>11}")
+    for engine in args.engines.split(","):
+        for threads in args.threads.split(","):
+            for frontier in args.frontiers.split(","):
+                settings = {
+                    "engine": engine, "threads": int(threads), "frontier": frontier,
+                    "seed_urls": site.seed_urls(), "politeness": args.politeness,
+                    "cache_server": list(server.cache_server), "metrics": args.metrics,
+                    "url_log_rate": args.url_log_rate,
+                }
+                child = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.crawl", "--child", json.dumps(settings)],
+                    cwd=repo_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                if child.returncode != 0:
+                    print(f"{engine:>8} {threads:>7} {frontier:>8} failed with exit code {child.returncode}")
+                    continue
+                # The last line is the result, Config prints the user agent before it.
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+                print(f"{engine:>8} {threads:>7} {frontier:>8} {result['pages']:>6} "
+                      f"{result['fetches'] / result['seconds']:>9.1f} "
+                      f"{result['p50_seconds'] * 1000:>7.1f} {result['p99_seconds'] * 1000:>7.1f} "
+                      f"{result['cpu_seconds']:>6.2f} {result['peak_rss_mb']:>7.1f} "
+                      f"{result['log_seconds'] * 1e6:>6.1f} {result['sync_log_seconds'] * 1e6:>11.1f}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
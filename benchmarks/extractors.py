@@ -0,0 +1,69 @@
+'''
+Pages per second of each link/text extractor backend in extractors.py, and
+whether each backend returns exactly the same links and text as bs4.
+
+    python -m benchmarks.extractors [corpus_dir]
+
+corpus_dir holds saved .html pages; without it a synthetic corpus is used.
+'''
+import os
+import sys
+import time
+import random
+
+from extractors import extractors
+
+def synthetic_corpus(pages=200, seed=0):
+    rng = random.Random(seed)
+    words = ["computer", "science", "research", "student", "faculty", "the", "and",
+             "informatics", "&amp;", "&nbsp;", "&#8217;", "data", "uci", "ics"]
+    corpus = []
+    for page in range(pages):
+        parts = ["<!DOCTYPE html><html><head><title>Page</title>",
+                 "<style>body { margin: 0 }</style><script>var x = '<a href=no>';</script></head><body>\n"]
+        for block in range(rng.randint(20, 200)):
+            parts.append("  <div class=\"c\"><p>")
+            parts.append(" ".join(rng.choice(words) for _ in range(rng.randint(5, 60))))
+            parts.append(f"</p><a href=\"/page/{rng.randint(0, 5000)}#top\">link</a></div>\n")
+        parts.append("<!-- footer --></body></html>")
+        corpus.append(("https://www.ics.uci.edu/dir/index.html", "".join(parts).encode("utf-8")))
+    return corpus + charset_pages()
+
+def charset_pages():
+    # Non-ASCII pages with a declared charset: the text must be decoded with
+    # the charset the page declares, even where its bytes are valid UTF-8
+    page = "<html><head>{}</head><body><p>Caf\u00e9 na\u00efve r\u00e9sum\u00e9</p><a href=\"caf\u00e9.html\">x</a></body></html>"
+    pages = [('<meta charset="utf-8">', "utf-8"),
+             ('<meta charset="iso-8859-1">', "iso-8859-1"),
+             ('<meta charset="iso-8859-1">', "utf-8"),
+             ('<meta http-equiv="Content-Type" content="text/html; charset=windows-1252">', "utf-8"),
+             ("", "utf-8")]
+    corpus = [("https://www.ics.uci.edu/dir/cafe.html", page.format(meta).encode(encoding))
+              for meta, encoding in pages]
+    # Declared in an <?xml?> declaration instead (lxml rejects it in a str)
+    corpus.append(("https://www.ics.uci.edu/dir/cafe.xhtml",
+                   ('<?xml version="1.0" encoding="iso-8859-1"?>' + page.format("")).encode("iso-8859-1")))
+    return corpus
+
+def load_corpus(corpus_dir):
+    corpus = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith(".html"):
+            with open(os.path.join(corpus_dir, name), "rb") as page_file:
+                corpus.append(("https://www.ics.uci.edu/" + name, page_file.read()))
+    return corpus
+
+def main(corpus_dir=None):
+    corpus = load_corpus(corpus_dir) if corpus_dir else synthetic_corpus()
+    expected = [extractors["bs4"](url, content) for url, content in corpus]
+    print(f"{len(corpus)} pages, {sum(len(c) for _, c in corpus) / 1024:.0f} KB")
+    for backend, extract in extractors.items():
+        start = time.perf_counter()
+        results = [extract(url, content) for url, content in corpus]
+        elapsed = time.perf_counter() - start
+        mismatches = sum(result != exp for result, exp in zip(results, expected))
+        print(f"{backend:>8}: {len(corpus) / elapsed:8.1f} pages/sec, "
+              f"{mismatches} pages differ from bs4")
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
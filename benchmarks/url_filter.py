@@ -0,0 +1,107 @@
+'''
+Speed of scraper.is_valid / scraper.filter_urls against the previous
+regex-based is_valid, and a check that both give the same verdicts.
+Repeated links are mostly answered by the verdict caches, so the compiled
+rules are also timed on their own with the caches disabled.
+
+    python -m benchmarks.url_filter [urls.txt | frontier.db]
+
+The corpus is a text file with one url per line or a sqlite frontier save
+file; without it a synthetic corpus is used.
+'''
+import re
+import sys
+import time
+import random
+import sqlite3
+
+from urllib.parse import urlparse, parse_qs
+
+import scraper
+from utils.url_filter import UrlFilter
+
+def legacy_is_valid(url):
+    # is_valid before the rules were compiled into utils.url_filter
+    parsed = urlparse(url)
+    if parsed.scheme not in set(["http", "https"]):
+        return False
+    domain = parsed.netloc.replace("www.", "")
+    valid_subdomain = False
+    for d in scraper.valid_domains:
+        if domain == d or domain.endswith("." + d):
+            valid_subdomain = True
+    if not valid_subdomain: return False
+    url_path = parsed.path.strip("/")
+    for p in scraper.paths_to_avoid:
+        if url_path.startswith(p):
+            return False
+    query_string = parsed.query
+    if query_string:
+        query_params = parse_qs(parsed.query)
+        if len(query_params) > 2:
+            return False
+        for param in query_params.keys():
+            for ignore_param in ("filter", "limit", "order", "sort"):
+                if param.startswith(ignore_param):
+                    return False
+    if parsed.path.startswith("/~"):
+        return False
+    return not re.match(
+        r".*\.(css|js|bmp|gif|jpe?g|ico"
+        + r"|png|tiff?|mid|mp2|mp3|mp4|lif|rle"
+        + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+        + r"|ps|eps|tex|ppt|pptx|ppsx|doc|docx|xls|xlsx|names"
+        + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+        + r"|epub|dll|cnf|tgz|sha1"
+        + r"|thmx|mso|arff|rtf|jar|csv"
+        + r"|java|php|py|txt|sql|war|apk|rpm"
+        + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
+
+def synthetic_corpus(count=100000, seed=0):
+    rng = random.Random(seed)
+    hosts = ["www.ics.uci.edu", "ics.uci.edu", "vision.ics.uci.edu", "www.cs.uci.edu",
+             "www.informatics.uci.edu", "www.stat.uci.edu", "www.uci.edu", "example.com"]
+    paths = ["/", "/about", "/people/", "/events/2020-01-01", "/~eppstein/pix", "/tag/ai",
+             "/research/areas", "/files/paper.pdf", "/img/logo.png", "/courses/cs121",
+             "/news/story-123", "/page/4"]
+    queries = ["", "", "", "?p=1", "?filter=x", "?a=1&b=2&c=3", "?page=2&lang=en"]
+    # Nav bars and footers make most links repeats of a small set
+    pool = [f"{rng.choice(['https', 'http'])}://{rng.choice(hosts)}{rng.choice(paths)}{rng.choice(queries)}"
+            for _ in range(2000)]
+    return [rng.choice(pool) for _ in range(count)]
+
+def load_corpus(path):
+    if path.endswith(".db"):
+        with sqlite3.connect(path) as conn:
+            return [url for (url,) in conn.execute("SELECT url FROM urls")]
+    with open(path, "r") as url_file:
+        return [line.strip() for line in url_file if line.strip()]
+
+def main(path=None):
+    urls = load_corpus(path) if path else synthetic_corpus()
+    start = time.perf_counter()
+    expected = [url for url in urls if legacy_is_valid(url)]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = scraper.filter_urls(urls)
+    compiled_time = time.perf_counter() - start
+
+    # Same rules without any verdict cache: every url is decided from scratch
+    uncached_filter = UrlFilter(scraper.valid_domains, scraper.paths_to_avoid,
+                                scraper.non_webpage_extensions, scraper.max_query_params,
+                                scraper.ignored_query_params, cache_size=0)
+    start = time.perf_counter()
+    uncached_result = uncached_filter.filter_urls(urls)
+    uncached_time = time.perf_counter() - start
+
+    print(f"{len(urls)} urls ({len(set(urls))} distinct), {len(expected)} valid")
+    print(f"        legacy is_valid: {len(urls) / legacy_time:12.0f} urls/sec")
+    print(f"            filter_urls: {len(urls) / compiled_time:12.0f} urls/sec "
+          f"({legacy_time / compiled_time:.1f}x)")
+    print(f"  filter_urls, no cache: {len(urls) / uncached_time:12.0f} urls/sec "
+          f"({legacy_time / uncached_time:.1f}x)")
+    print(f"  same verdicts: {result == expected and uncached_result == expected}")
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
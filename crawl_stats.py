@@ -1,11 +1,42 @@
 from itertools import islice
+from collections import Counter
 from urllib.parse import urlparse
 import os
+import sys
 import json
+import time
+import pickle
+import atexit
 import re
+import glob
+
+from configparser import ConfigParser
+from threading import RLock, Lock
+
+from utils import get_host
+from utils.space_saving import SpaceSaving
+from utils.metrics import metrics
+
+# We will suppose a word is a sequence of alphabetical chararters, hyphen, or apostrophe
+word_pattern = re.compile(r"[a-zA-Z'-]{2,}")
+
+def count_words(page_content, stopwords=frozenset()):
+    # Returns the number of words on the page and their frequencies without stop words.
+    words = word_pattern.findall(page_content)
+    # Lowercase every token in one call instead of one at a time
+    words = " ".join(words).lower().split()
+    page_frequencies = Counter(words)
+    # Drop stop words once per distinct word rather than once per token
+    for w in stopwords.intersection(page_frequencies):
+        del page_frequencies[w]
+    return len(words), page_frequencies
 
 class Crawl_Stats():
-    def __init__(self, restart):
+    def __init__(self, restart, checkpoint_pages=100, checkpoint_interval=30.0,
+                 save_format="json", delta_log=False, word_counts="exact", sketch_size=10000,
+                 save_prefix="stats_data", read_only=False):
+        # Workers update the stats concurrently
+        self.lock = RLock()
         self.stats = {
             "total_urls": 0,
             "total_pages": 0,
@@ -14,72 +45,304 @@ class Crawl_Stats():
             "ics_subdomain_pages": {}
         }
              
+        # With word_counts = "sketch", word frequencies are kept in a fixed size
+        # Space-Saving sketch (saved as "word_sketch") instead of exactly.
+        self.word_sketch = SpaceSaving(sketch_size) if word_counts == "sketch" else None
+
+        # Per-host crawl yield of this run, used to prioritize the frontier:
+        # host -> pages fetched, host -> words seen for the first time
+        self.host_fetches = Counter()
+        self.host_new_words = Counter()
+
         self.stopwords_file = "english_stopwords.txt"
-        self.stopwords = []
+        self.stopwords = frozenset()
         self._retrieve_stop_words()
 
-        self.stats_save_file = "stats_data.json"
+        # The full stats are only written out as a checkpoint every
+        # checkpoint_pages pages or checkpoint_interval seconds. With the
+        # delta log enabled, every update is also appended to a log that is
+        # replayed on load, so nothing is lost between checkpoints. Every
+        # update has a sequence number and the checkpoint records the last
+        # one it contains, so no update is replayed twice.
+        self.checkpoint_pages = checkpoint_pages
+        self.checkpoint_interval = checkpoint_interval
+        self.save_format = save_format
+        self.updates_since_checkpoint = 0
+        self.pages_since_checkpoint = 0
+        self.last_checkpoint = time.time()
+        self.log_sequence = 0
+        # Held while a checkpoint is written, which happens outside self.lock
+        self.checkpoint_lock = Lock()
+
+        self.stats_save_file = save_prefix + (".pickle" if save_format == "pickle" else ".json")
+        self.stats_log_file = save_prefix + ".log"
+        # Updates logged before the checkpoint being written, deleted once it is on disk
+        self.stats_old_log_file = self.stats_log_file + ".1"
+        self.delta_log = None
+        # A read only instance (the offline report) loads the stats and the
+        # delta log but never writes a checkpoint or removes a log, so it can
+        # run next to a live crawl.
+        self.read_only = read_only
         if restart:
             # Clear the data from the save file
             self._save_data()
         else:
             # Try to load existing data from the save file
             self._load_data()
+        if read_only:
+            return
+        if delta_log:
+            self.delta_log = open(self.stats_log_file, "a")
+
+        # Make sure the last updates are written out when the crawler exits
+        atexit.register(self.flush)
 
     def compute_url_stats(self, url):
+        # Called by the frontier with its lock held, so it never writes a checkpoint.
+        with self.lock:
+            # Check whether the url has a subdomain of the ics.uci.edu domain
+            parsed = urlparse(url)
+            subdomain = parsed.netloc.replace("www.", "")
+            self._apply_url_stats(subdomain)
+            self._log_delta({"subdomain": subdomain})
+
+    def _apply_url_stats(self, subdomain):
         # Update total url count
         self.stats["total_urls"] += 1
 
-        # Check whether the url has a subdomain of the ics.uci.edu domain
-        parsed = urlparse(url)
-        subdomain = parsed.netloc.replace("www.", "")
         if subdomain.endswith(".ics.uci.edu"):
             # Update number of pages found for the subdomain
             if subdomain not in self.stats["ics_subdomain_pages"].keys():
                 self.stats["ics_subdomain_pages"][subdomain] = 0
             self.stats["ics_subdomain_pages"][subdomain] += 1
 
-        self._save_data()
-
     def compute_page_stats(self, url, page_content):
+        # Counts the words of the page text and adds them to the stats.
         if page_content:
-            # Compute page statistics
-            self.stats["total_pages"] += 1
-
-            words = re.findall(r"[a-zA-Z'-]{2,}", page_content) # We will suppose a word is a sequence of alphabetical chararters, hyphen, or apostrophe
-            
-            # Number of words
-            if len(words) > self.stats["longest_page"][1]:
-                self.stats["longest_page"] = [url, len(words)]
-
-            # Frequencies of words
-            for w in words:
-                w = w.lower()
-                if w not in self.stopwords:
-                    if w not in self.stats["word_frequencies"].keys():
-                        self.stats["word_frequencies"][w] = 0
-                    self.stats["word_frequencies"][w] += 1
-        
+            self.merge_page_stats(url, *count_words(page_content, self.stopwords))
+
+    def compute_pages_stats(self, pages):
+        # Batched version of compute_page_stats for a list of (url, page_content).
+        # The pages are counted outside the lock and merged in one locked pass.
+        counted = [(url, count_words(page_content, self.stopwords))
+                   for url, page_content in pages if page_content]
+        with self.lock:
+            for url, (word_count, page_frequencies) in counted:
+                self._merge_page(url, word_count, page_frequencies)
+            checkpoint_due = self._checkpoint_due()
+        if checkpoint_due:
+            self._save_data(wait=False)
+
+    def merge_page_stats(self, url, word_count, page_frequencies):
+        # Adds the counts of one page that were computed elsewhere, e.g. in a parse pool process.
+        with self.lock:
+            self._merge_page(url, word_count, page_frequencies)
+            checkpoint_due = self._checkpoint_due()
+        if checkpoint_due:
+            self._save_data(wait=False)
+
+    def _merge_page(self, url, word_count, page_frequencies):
+        # Must be called with self.lock held.
+        new_words = self._apply_page_stats(url, word_count, page_frequencies)
+        self.host_new_words[get_host(url)] += new_words
+        self._log_delta({"page": url, "words": word_count, "frequencies": page_frequencies})
+        self.pages_since_checkpoint += 1
+
+    def _apply_page_stats(self, url, word_count, page_frequencies):
+        # Compute page statistics
+        self.stats["total_pages"] += 1
+
+        # Number of words
+        if word_count > self.stats["longest_page"][1]:
+            self.stats["longest_page"] = [url, word_count]
+
+        # Merging the page counts is O(distinct words on the page)
+        if self.word_sketch is not None:
+            return sum(self.word_sketch.add(w, count) for w, count in page_frequencies.items())
+        word_frequencies = self.stats["word_frequencies"]
+        new_words = 0
+        for w, count in page_frequencies.items():
+            old_count = word_frequencies.get(w, 0)
+            if not old_count:
+                new_words += 1
+            word_frequencies[w] = old_count + count
+        return new_words
+
+    def merge_stats(self, other):
+        # Adds the statistics of another crawl, e.g. of another shard. Shards
+        # count disjoint hosts, so every count is a plain sum.
+        with self.lock:
+            self.stats["total_urls"] += other.stats["total_urls"]
+            self.stats["total_pages"] += other.stats["total_pages"]
+            if other.stats["longest_page"][1] > self.stats["longest_page"][1]:
+                self.stats["longest_page"] = list(other.stats["longest_page"])
+            for subdomain, pages in other.stats["ics_subdomain_pages"].items():
+                self.stats["ics_subdomain_pages"][subdomain] = self.stats["ics_subdomain_pages"].get(subdomain, 0) + pages
+            word_frequencies = self.stats["word_frequencies"]
+            for w, count in other.stats["word_frequencies"].items():
+                word_frequencies[w] = word_frequencies.get(w, 0) + count
+            self.updates_since_checkpoint += 1
+
+    def record_fetch(self, url):
+        # Called by the frontier once a url of the host has been processed.
+        with self.lock:
+            self.host_fetches[get_host(url)] += 1
+
+    def host_yield(self, host):
+        # Returns (pages fetched, new words found) for the host in this run.
+        with self.lock:
+            return self.host_fetches[host], self.host_new_words[host]
+
+    def _log_delta(self, delta):
+        # Must be called with self.lock held.
+        self.log_sequence += 1
+        if self.delta_log is not None:
+            delta["seq"] = self.log_sequence
+            self.delta_log.write(json.dumps(delta, separators=(",", ":")) + "\n")
+            self.delta_log.flush()
+        self.updates_since_checkpoint += 1
+
+    def _checkpoint_due(self):
+        # Must be called with self.lock held. Only pages count: every page
+        # discovers many urls, and a checkpoint costs O(vocabulary).
+        return (self.pages_since_checkpoint >= self.checkpoint_pages
+                or (self.updates_since_checkpoint
+                    and time.time() - self.last_checkpoint >= self.checkpoint_interval))
+
+    def flush(self):
+        # Shutdown hook: write a final checkpoint if anything changed.
+        with self.lock:
+            changed = self.updates_since_checkpoint
+        if changed:
             self._save_data()
 
-    def _save_data(self):
-        json_object = json.dumps(self.stats, indent=4)
-        with open(self.stats_save_file, "w") as outfile:
-            outfile.write(json_object)
+    def _save_data(self, wait=True):
+        # Only the copy of the stats is made under self.lock; serializing and
+        # writing them do not hold up the workers or the frontier. Without
+        # wait, nothing is done while another checkpoint is being written.
+        if self.read_only:
+            return
+        if not self.checkpoint_lock.acquire(blocking=wait):
+            return
+        try:
+            with self.lock:
+                snapshot = self._snapshot()
+            with metrics.time("stats_checkpoint"):
+                self._write_checkpoint(snapshot)
+        finally:
+            self.checkpoint_lock.release()
+
+    def _snapshot(self):
+        # Must be called with self.lock held. Copies the stats and starts a
+        # new delta log, the old one holds exactly the updates in the copy.
+        snapshot = dict(self.stats)
+        snapshot["longest_page"] = list(self.stats["longest_page"])
+        snapshot["word_frequencies"] = dict(self.stats["word_frequencies"])
+        snapshot["ics_subdomain_pages"] = dict(self.stats["ics_subdomain_pages"])
+        if self.word_sketch is not None:
+            sketch = self.word_sketch.to_dict()
+            sketch["counters"] = {w: list(counter) for w, counter in sketch["counters"].items()}
+            snapshot["word_sketch"] = sketch
+        snapshot["log_sequence"] = self.log_sequence
+        if self.delta_log is not None:
+            self.delta_log.close()
+            if os.path.exists(self.stats_old_log_file):
+                # The last checkpoint failed, keep its updates as well
+                with open(self.stats_old_log_file, "a") as old_log, open(self.stats_log_file, "r") as log:
+                    old_log.write(log.read())
+                os.remove(self.stats_log_file)
+            else:
+                os.replace(self.stats_log_file, self.stats_old_log_file)
+            self.delta_log = open(self.stats_log_file, "a")
+        self.updates_since_checkpoint = 0
+        self.pages_since_checkpoint = 0
+        self.last_checkpoint = time.time()
+        return snapshot
+
+    def _write_checkpoint(self, snapshot):
+        # Write the checkpoint to a temporary file and atomically rename it,
+        # so a crash never leaves a half written stats file behind.
+        tmp_file = self.stats_save_file + ".tmp"
+        if self.save_format == "pickle":
+            with open(tmp_file, "wb") as outfile:
+                pickle.dump(snapshot, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            json_object = json.dumps(snapshot, indent=4)
+            with open(tmp_file, "w") as outfile:
+                outfile.write(json_object)
+        os.replace(tmp_file, self.stats_save_file)
+
+        # The checkpoint now contains every update of the old log. If the
+        # crawl stops before it is removed, its sequence numbers are skipped.
+        stale_logs = [self.stats_old_log_file]
+        if self.delta_log is None:
+            # Left over from a run with the delta log enabled
+            stale_logs.append(self.stats_log_file)
+        for log_file in stale_logs:
+            if os.path.exists(log_file):
+                os.remove(log_file)
 
     def _load_data(self):
         if os.path.exists(self.stats_save_file):
-            with open(self.stats_save_file, 'r') as openFile:
-                self.stats = json.load(openFile)
+            if self.save_format == "pickle":
+                with open(self.stats_save_file, 'rb') as openFile:
+                    self.stats = pickle.load(openFile)
+            else:
+                with open(self.stats_save_file, 'r') as openFile:
+                    self.stats = json.load(openFile)
+            self.log_sequence = self.stats.pop("log_sequence", 0)
+            self._load_word_sketch()
+            if self._replay_delta_log():
+                # Fold the replayed updates into a checkpoint before logging new ones
+                self._save_data()
         else:
             self._save_data()
 
+    def _load_word_sketch(self):
+        # Switching between exact and sketch counts keeps the counts seen so far.
+        saved_sketch = self.stats.pop("word_sketch", None)
+        if self.word_sketch is not None:
+            if saved_sketch is not None:
+                self.word_sketch = SpaceSaving.from_dict(saved_sketch, self.word_sketch.capacity)
+            for w, count in self.stats["word_frequencies"].items():
+                self.word_sketch.add(w, count)
+            self.stats["word_frequencies"] = {}
+        elif saved_sketch is not None:
+            for w, (count, error) in saved_sketch["counters"].items():
+                self.stats["word_frequencies"][w] = self.stats["word_frequencies"].get(w, 0) + count
+
+    def _replay_delta_log(self):
+        # Apply the updates that were logged after the last checkpoint, and
+        # return how many there were.
+        checkpoint_sequence = self.log_sequence
+        replayed = 0
+        for log_file in (self.stats_old_log_file, self.stats_log_file):
+            if not os.path.exists(log_file):
+                continue
+            with open(log_file, 'r') as openFile:
+                for line in openFile:
+                    try:
+                        delta = json.loads(line)
+                    except ValueError:
+                        # Last line was cut off by a crash
+                        break
+                    # Logs written before sequence numbers are always applied
+                    sequence = delta.get("seq", checkpoint_sequence + 1)
+                    if sequence <= checkpoint_sequence:
+                        continue
+                    self.log_sequence = max(self.log_sequence, sequence)
+                    if "subdomain" in delta:
+                        self._apply_url_stats(delta["subdomain"])
+                    else:
+                        self._apply_page_stats(delta["page"], delta["words"], delta["frequencies"])
+                    replayed += 1
+        self.updates_since_checkpoint += replayed
+        return replayed
+
     def _retrieve_stop_words(self):
         if os.path.exists(self.stopwords_file):
             with open(self.stopwords_file, 'r') as openFile:
-                for line in openFile:
-                    word = line.strip()
-                    self.stopwords.append(word)
+                self.stopwords = frozenset(line.strip() for line in openFile)
         
     def print_total_urls(self):
         total_urls = self.stats["total_urls"]
@@ -93,6 +356,12 @@ class Crawl_Stats():
     def print_most_common_words(self):
         # 50 most common words (ignoring English stop words) ordered with decreasing frequency
         print("50 most common words:")
+        if self.word_sketch is not None:
+            # O(K log 50) over the K sketch counters instead of sorting every word
+            for word, count, error in self.word_sketch.top(50):
+                print(word)
+            print(f"(approximate, every count is at most {self.word_sketch.error_bound()} too high)")
+            return
         ordered_words = dict(sorted(self.stats["word_frequencies"].items(), key=lambda item: item[1], reverse=True))
         top_50_words = list(islice(ordered_words, 50))
         for word in top_50_words:
@@ -113,8 +382,46 @@ class Crawl_Stats():
         self.print_most_common_words()
         self.print_ics_subdomains()
 
+def merge_shards(prefix="stats_data"):
+    # Sums the stats files of every shard (stats_data.shardN.json or .pickle)
+    # into stats_data.merged. Run it once the shards have stopped.
+    # Only the live shard files: stats_data.shardN.replay.json (a replay of a
+    # shard's page store) counts the same pages again.
+    shard_file_pattern = re.compile(re.escape(os.path.basename(prefix)) + r"\.shard\d+\.(json|pickle)")
+    merged = Crawl_Stats(True, save_prefix=prefix + ".merged")
+    for path in sorted(glob.glob(glob.escape(prefix) + ".shard*")):
+        if not shard_file_pattern.fullmatch(os.path.basename(path)):
+            continue
+        shard_prefix, extension = os.path.splitext(path)
+        shard = Crawl_Stats(False, save_format=extension[1:], save_prefix=shard_prefix, read_only=True)
+        merged.merge_stats(shard)
+        print(f"Merged {path}")
+    merged.flush()
+    return merged
+
+def report_settings(config_file="config.ini", prefix="stats_data"):
+    # Save format and word counting of the [STATS] section of config.ini. If
+    # there is no stats file in that format, the one that exists is read.
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    save_format = cparser.get("STATS", "FORMAT", fallback="json").strip()
+    word_counts = cparser.get("STATS", "WORDCOUNTS", fallback="exact").strip()
+    sketch_size = cparser.getint("STATS", "SKETCHSIZE", fallback=10000)
+    if not os.path.exists(prefix + "." + save_format):
+        for extension in ("json", "pickle"):
+            if os.path.exists(prefix + "." + extension):
+                save_format = extension
+                break
+    return save_format, word_counts, sketch_size
+
 def main():
-    crawl_stats = Crawl_Stats(False)
+    if "--merge" in sys.argv[1:]:
+        crawl_stats = merge_shards()
+    else:
+        # Only reads the stats (and the delta log), a running crawl keeps writing them
+        save_format, word_counts, sketch_size = report_settings()
+        crawl_stats = Crawl_Stats(False, save_format=save_format, word_counts=word_counts,
+                                  sketch_size=sketch_size, read_only=True)
     crawl_stats.print_all_stats()
 
 if __name__ == "__main__":
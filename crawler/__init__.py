@@ -1,21 +1,45 @@
+from concurrent.futures import ProcessPoolExecutor
+
 from utils import get_logger
+from utils.log_queue import log_pipeline
+from utils.metrics import metrics
+from utils.simhash import DuplicateIndex
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.robots import RobotsCache
+from crawler.page_store import open_page_store
 from crawl_stats import Crawl_Stats
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
+        # Url line sampling and log file flushing
+        log_pipeline.configure(config)
         self.logger = get_logger("CRAWLER")
-        self.crawl_stats = Crawl_Stats(restart)
+        # Stage timers, counters and the optional metrics endpoint and profiler
+        metrics.configure(config)
+        self.crawl_stats = Crawl_Stats(
+            restart, config.stats_checkpoint_pages, config.stats_checkpoint_interval,
+            config.stats_format, config.stats_delta_log,
+            config.stats_word_counts, config.stats_sketch_size, config.stats_prefix)
 
         self.frontier = frontier_factory(config, restart, self.crawl_stats)
+        self.robots_cache = RobotsCache(config, restart)
+        self.duplicates = DuplicateIndex(config, restart)
+        # Optional compressed copy of every downloaded page, for --replay
+        self.page_store = open_page_store(config, restart)
+        # Optional processes that parse pages outside the workers' GIL
+        self.parse_pool = (
+            ProcessPoolExecutor(config.parse_processes)
+            if config.parse_processes > 0 else None)
         self.workers = list()
         self.worker_factory = worker_factory
 
     def start_async(self):
         self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier, self.crawl_stats)
+            self.worker_factory(
+                worker_id, self.config, self.frontier, self.crawl_stats,
+                self.robots_cache, self.parse_pool, self.duplicates, self.page_store)
             for worker_id in range(self.config.threads_count)]
         for worker in self.workers:
             worker.start()
@@ -27,3 +51,16 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+        self.close()
+
+    def close(self):
+        # Flush everything that is saved between runs.
+        self.frontier.close()
+        self.crawl_stats.flush()
+        self.robots_cache.save()
+        self.duplicates.save()
+        if self.page_store is not None:
+            self.page_store.close()
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
+        metrics.stop()
@@ -0,0 +1,109 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from crawler import Crawler
+from crawler.frontier import Frontier
+from utils import get_logger
+from utils.download import download_async, close_async_pool
+from utils.log_queue import log_pipeline
+from utils.metrics import metrics
+import scraper
+
+
+class AsyncCrawler(Crawler):
+    '''
+    Crawler that runs every fetch to the cache server as a task on one
+    asyncio event loop instead of one blocking thread per worker. Up to
+    config.max_in_flight downloads run at once. The frontier still decides
+    which url may be fetched next (so per-domain politeness is unchanged).
+    Downloads reuse keep-alive connections to the cache server, and decoding
+    responses, storing pages, scraping, robots.txt and frontier updates run
+    in a thread pool so none of them stalls the loop.
+    '''
+    def __init__(self, config, restart, frontier_factory=Frontier):
+        super().__init__(config, restart, frontier_factory)
+        self.worker_logger = get_logger("AsyncWorker", "Worker")
+
+    def start(self):
+        asyncio.run(self._crawl())
+        self.close()
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        # get_tbd_url blocks until a host is ready, so it gets its own thread.
+        self.dispatch_executor = ThreadPoolExecutor(max_workers=1)
+        self.parse_executor = ThreadPoolExecutor(max_workers=max(1, self.config.threads_count))
+        in_flight = asyncio.Semaphore(self.config.max_in_flight)
+        tasks = set()
+        try:
+            while True:
+                await in_flight.acquire()
+                with metrics.time("frontier_wait"):
+                    tbd_url = await loop.run_in_executor(
+                        self.dispatch_executor, self.frontier.get_tbd_url)
+                if not tbd_url:
+                    self.worker_logger.info("Frontier is empty. Stopping Crawler.")
+                    break
+                task = loop.create_task(self._process(tbd_url, in_flight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            close_async_pool(self.config)
+            self.dispatch_executor.shutdown()
+            self.parse_executor.shutdown()
+
+    async def _process(self, tbd_url, in_flight):
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                with metrics.time("download"):
+                    resp = await download_async(
+                        tbd_url, self.config, self.worker_logger, self.parse_executor)
+                metrics.count_fetch(tbd_url)
+                if self.page_store is not None:
+                    # Compressing and writing the page happen off the loop
+                    await loop.run_in_executor(self.parse_executor, self.page_store.put, tbd_url, resp)
+            except Exception:
+                # Release the host, or the frontier would wait for it forever.
+                self.worker_logger.exception(f"Error downloading {tbd_url}, skipped.")
+                await loop.run_in_executor(self.parse_executor, self._complete, tbd_url)
+                return
+            # Only a sample of the successful downloads is logged, failures always are
+            if resp.status != 200:
+                self.worker_logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, error {resp.error}, "
+                    f"using cache {self.config.cache_server}.")
+            elif log_pipeline.sample_url():
+                self.worker_logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"using cache {self.config.cache_server}.")
+            await loop.run_in_executor(self.parse_executor, self._scrape, tbd_url, resp)
+        finally:
+            in_flight.release()
+
+    def _complete(self, tbd_url):
+        with metrics.time("mark_complete"):
+            self.frontier.mark_url_complete(tbd_url)
+
+    def _scrape(self, tbd_url, resp):
+        # Same steps as Worker.run after the download.
+        try:
+            with metrics.time("robots"):
+                self.robots_cache.fetch(urlparse(tbd_url))
+            with metrics.time("scrape"):
+                scraped_urls = scraper.scraper(
+                    tbd_url, resp, self.crawl_stats, self.parse_pool, self.duplicates,
+                    getattr(self.frontier, "traps", None))
+            with metrics.time("add_links"):
+                for scraped_url in scraped_urls:
+                    if self.robots_cache.can_fetch(scraped_url):
+                        self.frontier.add_url(scraped_url)
+        except Exception:
+            self.worker_logger.exception(f"Error processing {tbd_url}, skipped.")
+        finally:
+            # Release the host even if scraping failed so the crawl can finish.
+            self._complete(tbd_url)
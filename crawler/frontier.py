@@ -1,80 +1,254 @@
-import os
-import shelve
-
-from threading import Thread, RLock
-from queue import Queue, Empty
-
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
-
-from urllib.parse import urlparse
-
-class Frontier(object):
-    def __init__(self, config, restart, crawl_stats=None):
-        self.logger = get_logger("FRONTIER")
-        self.config = config
-        self.crawl_stats = crawl_stats
-        self.to_be_downloaded = list()
-        
-        if not os.path.exists(self.config.save_file) and not restart:
-            # Save file does not exist, but request to load save.
-            self.logger.info(
-                f"Did not find save file {self.config.save_file}, "
-                f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
-            # Save file does exists, but request to start from seed.
-            self.logger.info(
-                f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
-        # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
-        if restart:
-            for url in self.config.seed_urls:
-                self.add_url(url)
-        else:
-            # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if not self.save:
-                for url in self.config.seed_urls:
-                    self.add_url(url)
-
-    def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
-        total_count = self.total_urls = len(self.save)
-        tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
-        self.logger.info(
-            f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
-
-    def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop(0)
-        except IndexError:
-            return None
-
-    def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
-
-            # Compute stats for this unique url
-            if self.crawl_stats is not None:
-                self.crawl_stats.compute_url_stats(url)
-
-    
-    def mark_url_complete(self, url):
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
-
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+import os
+import time
+import heapq
+
+from itertools import count
+from threading import Thread, RLock, Condition
+from queue import Queue, Empty
+
+from utils import get_logger, get_urldigest, normalize, get_host
+from crawler.save_store import open_save_store, remove_save_file
+from crawler.seen_urls import SeenUrls
+from crawler.spill_queue import SpillFiles
+from crawler.scoring import UrlScorer
+from crawler.traps import TrapDetector
+from crawler.sharding import ShardRouter
+from utils.metrics import metrics
+from scraper import is_valid
+
+from urllib.parse import urlparse
+
+class Frontier(object):
+    def __init__(self, config, restart, crawl_stats=None):
+        self.logger = get_logger("FRONTIER")
+        self.config = config
+        self.crawl_stats = crawl_stats
+
+        # Per-host politeness scheduling. Every host has its own priority
+        # queue of urls, and hosts with queued urls sit in a heap ordered by
+        # the time they may next be contacted. Hosts past that time move to a
+        # second heap ordered by the score of their best url, so the best
+        # url among the hosts that may be contacted is crawled first. A host
+        # is "busy" from the moment one of its urls is handed out until that
+        # url is marked complete, so each host only ever has one request in
+        # flight.
+        self.lock = RLock()
+        self.ready = Condition(self.lock)
+        self.score_url = UrlScorer(self.config.url_scorers, crawl_stats)
+        self.sequence = count()     # Ties between equal scores go to the oldest url
+        self.host_queues = dict()   # host -> heap of (score, sequence, url) to be downloaded
+        self.ready_heap = list()    # (ready time, host) for idle hosts with queued urls
+        self.due_heap = list()      # (best url score, ready time, host) for hosts past their ready time
+        self.next_ready = dict()    # host -> earliest time the host may be contacted again
+        self.busy_hosts = set()
+        self.in_progress = 0        # urls handed out but not yet marked complete
+
+        # At most max_queued_urls urls are kept in the host queues. The rest
+        # wait on disk: the backlog of a resumed crawl is read lazily from the
+        # save file, and newly discovered urls overflow to spill segments. A
+        # url only goes to memory when nothing older is waiting on disk, so
+        # urls reach the host queues in the order they were discovered.
+        self.max_queued_urls = self.config.max_queued_urls
+        self.queued_urls = 0
+        self.backlog = None         # Iterator over the incomplete urls of the save file
+        self.spill = SpillFiles(self.config.save_file + ".spill", self.config.spill_segment_size)
+        
+        if not os.path.exists(self.config.save_file) and not restart:
+            # Save file does not exist, but request to load save.
+            self.logger.info(
+                f"Did not find save file {self.config.save_file}, "
+                f"starting from seed.")
+        elif os.path.exists(self.config.save_file) and restart:
+            # Save file does exists, but request to start from seed.
+            self.logger.info(
+                f"Found save file {self.config.save_file}, deleting it.")
+            remove_save_file(self.config.save_file)
+        # Load existing save file, or create one if it does not exist.
+        self.save = open_save_store(self.config)
+        # Learns crawler traps from the urls added here and the pages the scraper reports
+        self.traps = TrapDetector(self.config)
+        # With several shards, this frontier only keeps the urls of its own hosts
+        self.shards = ShardRouter(self.config, restart) if self.config.shard_count > 1 else None
+        # Queue depth, read only when the metrics are reported
+        metrics.gauge("frontier_queued_urls", lambda: self.queued_urls)
+        metrics.gauge("frontier_spilled_urls", lambda: len(self.spill))
+        metrics.gauge("frontier_hosts_queued", lambda: len(self.host_queues))
+        metrics.gauge("frontier_in_progress", lambda: self.in_progress)
+        # In-memory Bloom filter and digest set in front of the save file
+        self.seen_urls = SeenUrls(self.config.expected_urls, self.config.bloom_false_positive_rate)
+        if restart:
+            for url in self.config.seed_urls:
+                self.add_url(url)
+        else:
+            # Set the frontier state with contents of save file.
+            self._parse_save_file()
+            if not self.save:
+                for url in self.config.seed_urls:
+                    self.add_url(url)
+
+    def _parse_save_file(self):
+        ''' This function can be overridden for alternate saving techniques. '''
+        total_count = self.total_urls = len(self.save)
+        tbd_count = self.save.tbd_count()
+        for urlhash in self.save.keys():
+            self.seen_urls.add(bytes.fromhex(urlhash))
+        # The urls are loaded as the crawl goes, so it can start right away.
+        with self.lock:
+            self.backlog = self.save.tbd_urls()
+            self._refill()
+        self.logger.info(
+            f"Found {tbd_count} urls to be downloaded from {total_count} "
+            f"total urls discovered.")
+
+    def _push(self, url):
+        # Must be called with self.lock held.
+        if (self.backlog is None and not len(self.spill)
+                and self.queued_urls < self.max_queued_urls):
+            self._enqueue(url)
+        else:
+            self.spill.append(url)
+
+    def _refill(self):
+        # Must be called with self.lock held. Moves urls from disk to the
+        # host queues, oldest first, until the queues are half full.
+        while self.queued_urls < self.max_queued_urls // 2 or not self.host_queues:
+            if self.backlog is not None:
+                for url in self.backlog:
+                    if is_valid(url):
+                        self._enqueue(url)
+                    if self.queued_urls >= self.max_queued_urls:
+                        break
+                else:
+                    self.backlog = None
+            elif len(self.spill):
+                for url in self.spill.read_segment():
+                    self._enqueue(url)
+            else:
+                break
+            if self.queued_urls >= self.max_queued_urls:
+                break
+
+    def _enqueue(self, url):
+        # Must be called with self.lock held.
+        self.queued_urls += 1
+        host = get_host(url)
+        queue = self.host_queues.get(host)
+        if queue is None:
+            queue = self.host_queues[host] = list()
+        heapq.heappush(queue, (self.score_url(url), next(self.sequence), url))
+        # A host enters the heap when its queue becomes non-empty, unless it
+        # is busy (it will be rescheduled when its current url completes).
+        if len(queue) == 1 and host not in self.busy_hosts:
+            heapq.heappush(self.ready_heap, (self.next_ready.get(host, 0), host))
+            self.ready.notify()
+
+    def get_tbd_url(self):
+        # Blocks until some host is past its politeness deadline. Returns None
+        # only once every queue is empty and no url is still being processed,
+        # since an in-flight url may still add new links to the frontier.
+        with self.lock:
+            while True:
+                if self.shards is not None:
+                    for url in self.shards.exchange():
+                        self.add_url(url)
+                if self.queued_urls < self.max_queued_urls // 2 or not self.host_queues:
+                    self._refill()
+                now = time.time()
+                while self.ready_heap and self.ready_heap[0][0] <= now:
+                    ready_time, host = heapq.heappop(self.ready_heap)
+                    # Equal scores go to the host that has waited longest; hosts
+                    # never fetched (ready time 0) go first, in discovery order.
+                    heapq.heappush(self.due_heap, (self.host_queues[host][0][0],
+                                                   ready_time or next(self.sequence), host))
+                if self.due_heap:
+                    score, _, host = heapq.heappop(self.due_heap)
+                    queue = self.host_queues[host]
+                    url = heapq.heappop(queue)[2]
+                    self.queued_urls -= 1
+                    if not queue:
+                        del self.host_queues[host]
+                    if self.traps.is_banned(url):
+                        # Its template was banned after the url was queued.
+                        self.save[get_urldigest(url).hex()] = (url, True)
+                        if host in self.host_queues:
+                            heapq.heappush(self.ready_heap, (self.next_ready.get(host, 0), host))
+                        continue
+                    self.busy_hosts.add(host)
+                    self.in_progress += 1
+                    if self.shards is not None:
+                        self.shards.touch()
+                    return url
+                # A shard wakes up regularly to exchange urls with the others.
+                max_wait = self.shards.flush_interval if self.shards is not None else None
+                if self.ready_heap:
+                    wait_time = self.ready_heap[0][0] - now
+                    self.ready.wait(wait_time if max_wait is None else min(wait_time, max_wait))
+                elif self.in_progress == 0:
+                    if self.shards is not None:
+                        # Other shards may still send urls, so only stop once idle.
+                        self.shards.flush()
+                        if not self.shards.idle():
+                            self.ready.wait(max_wait)
+                            continue
+                    # Wake any other waiting workers so they can stop as well.
+                    self.ready.notify_all()
+                    return None
+                else:
+                    self.ready.wait(max_wait)
+
+    def add_url(self, url):
+        url = normalize(url)
+        urldigest = get_urldigest(url)
+        with self.lock:
+            if not self.seen_urls.seen(urldigest):
+                self.seen_urls.add(urldigest)
+                if self.shards is not None and not self.shards.owns(url):
+                    # Another shard crawls this host
+                    self.shards.forward(url)
+                    return
+                if not self.traps.admit(url):
+                    # Remembered as seen for this run, but never saved or queued
+                    return
+                self.save[urldigest.hex()] = (url, False)
+                self._push(url)
+
+                # Compute stats for this unique url
+                if self.crawl_stats is not None:
+                    self.crawl_stats.compute_url_stats(url)
+
+    
+    def mark_url_complete(self, url):
+        urldigest = get_urldigest(url)
+        host = get_host(url)
+        with self.lock:
+            if not self.seen_urls.seen(urldigest):
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            self.save[urldigest.hex()] = (url, True)
+            if self.crawl_stats is not None:
+                self.crawl_stats.record_fetch(url)
+
+            # Release the host and schedule its next url after the politeness delay.
+            if host in self.busy_hosts:
+                self.busy_hosts.discard(host)
+                self.in_progress -= 1
+            self.next_ready[host] = time.time() + self.config.time_delay
+            if host in self.host_queues:
+                heapq.heappush(self.ready_heap, (self.next_ready[host], host))
+            self.ready.notify_all()
+
+    def close(self):
+        # Commit any buffered writes to the save file.
+        with self.lock:
+            self.save.close()
+            self.spill.close()
+            if self.shards is not None:
+                self.shards.flush()
+                self.logger.info(
+                    f"Shard {self.config.shard_index}/{self.config.shard_count}: forwarded "
+                    f"{self.shards.forwarded} urls, received {self.shards.received} urls, "
+                    f"dropped {self.shards.inbox.stale_batches} batches of an earlier crawl.")
+        self.logger.info(f"Seen urls: {self.seen_urls.report()}")
+        self.logger.info(f"Traps: {self.traps.report()}")
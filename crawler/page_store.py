@@ -0,0 +1,165 @@
+import os
+import gzip
+import json
+import shutil
+
+from threading import Lock
+
+import requests
+
+from utils import get_urlhash
+from utils.response import Response
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _compressors(compression):
+    # Returns (compress, decompress) for one record.
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("PAGESTORECOMPRESSION = zstd needs the zstandard package.")
+        return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    return (lambda data: gzip.compress(data, compresslevel=6)), gzip.decompress
+
+
+class PageStore(object):
+    '''
+    Every downloaded response (url, status, error and the pickled response
+    as the cache server sent it) in append-only segment files of about
+    segment_size bytes. Each record is compressed on its own with gzip or
+    zstd, and index.txt lists the url hash, segment, offset and length of
+    every record, so a page can be read back without decompressing anything
+    else. A url stored again replaces the earlier record in the index.
+    '''
+    def __init__(self, directory, restart=False, compression="gzip", segment_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        if restart and os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory, exist_ok=True)
+        self.lock = Lock()
+        self.index = dict()     # urlhash -> (segment, offset, length, compression), in insertion order
+        self.index_path = os.path.join(directory, "index.txt")
+        self._load_index()
+        self.compression = compression
+        self.compress, _ = _compressors(compression)
+        self.segment = max((entry[0] for entry in self.index.values()), default=0)
+        self.writer = None
+        self.index_writer = open(self.index_path, "a", encoding="utf-8")
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:06d}.pages")
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as index_file:
+            for line in index_file:
+                fields = line.split()
+                if len(fields) != 5:
+                    # Last line was cut off by a crash
+                    break
+                urlhash, segment, offset, length, compression = fields
+                self.index.pop(urlhash, None)
+                self.index[urlhash] = (int(segment), int(offset), int(length), compression)
+
+    def __len__(self):
+        return len(self.index)
+
+    def put(self, url, resp):
+        header = {"url": url, "status": resp.status, "error": resp.error}
+        body = b""
+        if resp.pickled_response is not None:
+            # Stored as received, so the page is not decoded on the crawl's hot path
+            header["pickled"] = True
+            body = resp.pickled_response
+        elif resp.raw_response is not None:
+            raw_response = resp.raw_response
+            header["final_url"] = raw_response.url
+            header["headers"] = dict(raw_response.headers)
+            body = raw_response.content or b""
+        record = self.compress(json.dumps(header).encode("utf-8") + b"\n" + body)
+        urlhash = get_urlhash(url)
+        with self.lock:
+            if self.writer is None:
+                self.writer = open(self._segment_path(self.segment), "ab")
+            offset = self.writer.tell()
+            if offset and offset + len(record) > self.segment_size:
+                self.writer.close()
+                self.segment += 1
+                self.writer = open(self._segment_path(self.segment), "ab")
+                offset = 0
+            self.writer.write(record)
+            # The record must be on disk before the index points to it.
+            self.writer.flush()
+            self.index_writer.write(f"{urlhash} {self.segment} {offset} {len(record)} {self.compression}\n")
+            self.index_writer.flush()
+            self.index.pop(urlhash, None)
+            self.index[urlhash] = (self.segment, offset, len(record), self.compression)
+
+    def get(self, url):
+        entry = self.index.get(get_urlhash(url))
+        return self._read(entry) if entry is not None else None
+
+    def __iter__(self):
+        # Responses in the order they were stored, one segment file open at a time.
+        with self.lock:
+            if self.writer is not None:
+                self.writer.flush()
+            entries = sorted(self.index.values())
+        segment_file = None
+        segment = None
+        try:
+            for entry in entries:
+                if entry[0] != segment:
+                    if segment_file is not None:
+                        segment_file.close()
+                    segment = entry[0]
+                    segment_file = open(self._segment_path(segment), "rb")
+                yield self._decode(entry, segment_file)
+        finally:
+            if segment_file is not None:
+                segment_file.close()
+
+    def _read(self, entry):
+        with open(self._segment_path(entry[0]), "rb") as segment_file:
+            return self._decode(entry, segment_file)
+
+    def _decode(self, entry, segment_file):
+        segment, offset, length, compression = entry
+        segment_file.seek(offset)
+        data = _compressors(compression)[1](segment_file.read(length))
+        header, _, body = data.partition(b"\n")
+        return to_response(json.loads(header), body)
+
+    def close(self):
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+            self.index_writer.close()
+
+
+def to_response(header, body):
+    # Rebuilds the Response the scraper got when the page was downloaded.
+    if header.get("pickled"):
+        return Response({"url": header["url"], "status": header["status"], "error": header["error"],
+                         "response": body})
+    resp = Response({"url": header["url"], "status": header["status"], "error": header["error"]})
+    if "final_url" in header:
+        raw_response = requests.models.Response()
+        raw_response.url = header["final_url"]
+        raw_response.status_code = header["status"]
+        raw_response.headers.update(header["headers"])
+        raw_response._content = body
+        resp.raw_response = raw_response
+    return resp
+
+def open_page_store(config, restart):
+    if not config.page_store:
+        return None
+    return PageStore(config.page_store, restart, config.page_store_compression,
+                     config.page_store_segment_size)
@@ -0,0 +1,109 @@
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from utils import get_host, get_logger, get_urldigest, normalize
+from utils.log_queue import log_pipeline
+from utils.simhash import DuplicateIndex
+from crawler.page_store import PageStore
+from crawler.robots import RobotsCache
+from crawler.sharding import HashRing
+from crawler.traps import TrapDetector
+from crawl_stats import Crawl_Stats
+import scraper
+
+
+class _PrefetchedParses(object):
+    '''
+    Stands in for the parse pool in scraper.scraper: hands back the parse of
+    a page that was submitted to the real pool ahead of time, so pages are
+    parsed in parallel while the scraper runs them one at a time.
+    '''
+    def __init__(self, parse_pool):
+        self.parse_pool = parse_pool
+        self.futures = dict()   # url -> future of scraper.parse_page
+
+    def prefetch(self, resp, stopwords):
+        if 200 <= resp.status <= 299 and 0 < len(resp.body) <= scraper.max_size_kb * 1024:
+            self.futures[resp.url] = self.parse_pool.submit(
+                scraper.parse_page, resp.url, resp.raw_response.content, stopwords)
+
+    def submit(self, function, url, *args):
+        future = self.futures.pop(url, None)
+        return future if future is not None else self.parse_pool.submit(function, url, *args)
+
+
+class Replay(object):
+    '''
+    Runs the scraper and the crawl statistics again over the pages saved in
+    the page store, without downloading anything or waiting for politeness.
+    Pages are parsed in a process pool (PARSEPROCESSES, or one per CPU), but
+    handed to scraper.scraper one at a time in the order they were crawled,
+    so the duplicate index, statistics and trap detector see them in that
+    order. Like the frontier, every new valid link that robots.txt allows
+    (from the rules saved by the crawl) and the trap detector admits is
+    counted once in the statistics, written to stats_data.replay.json so the
+    statistics of the crawl itself are kept. A shard only counts the links of
+    its own hosts, the others were forwarded and counted by their shard.
+    '''
+    def __init__(self, config):
+        self.config = config
+        log_pipeline.configure(config)
+        self.logger = get_logger("REPLAY")
+        self.page_store = PageStore(config.page_store, False, config.page_store_compression,
+                                    config.page_store_segment_size)
+        # The statistics and duplicate index are computed again from scratch,
+        # the duplicate index of the crawl itself is left alone.
+        self.crawl_stats = Crawl_Stats(
+            True, config.stats_checkpoint_pages, config.stats_checkpoint_interval,
+            config.stats_format, False, config.stats_word_counts, config.stats_sketch_size,
+            config.stats_prefix + ".replay")
+        self.duplicates = DuplicateIndex(config, True, config.save_file + ".replay.fingerprints")
+        self.robots_cache = RobotsCache(config, False)
+        self.traps = TrapDetector(config)
+        self.parse_pool = ProcessPoolExecutor(config.parse_processes or os.cpu_count())
+        self.parses = _PrefetchedParses(self.parse_pool)
+        self.seen_urls = set()
+        # The frontier's ShardRouter hashes hosts onto shards the same way,
+        # the inboxes are left alone.
+        self.shard_ring = HashRing(config.shard_count) if config.shard_count > 1 else None
+
+    def _add_url(self, url):
+        url = normalize(url)
+        urlhash = get_urldigest(url)[:16]
+        if urlhash not in self.seen_urls:
+            self.seen_urls.add(urlhash)
+            if self.shard_ring is not None and self.shard_ring.shard_of(get_host(url)) != self.config.shard_index:
+                # Another shard crawls this host
+                return
+            if self.traps.admit(url):
+                self.crawl_stats.compute_url_stats(url)
+
+    def _scrape(self, resp):
+        return scraper.scraper(resp.url, resp, self.crawl_stats, self.parses, self.duplicates, self.traps)
+
+    def start(self, batch_size=256):
+        self.logger.info(f"Replaying {len(self.page_store)} pages from {self.config.page_store}.")
+        for url in self.config.seed_urls:
+            self._add_url(url)
+        pages = iter(self.page_store)
+        batch = list(islice(pages, batch_size))
+        for resp in batch:
+            self.parses.prefetch(resp, self.crawl_stats.stopwords)
+        while batch:
+            # The next batch is parsed while this one is scraped.
+            next_batch = list(islice(pages, batch_size))
+            for resp in next_batch:
+                self.parses.prefetch(resp, self.crawl_stats.stopwords)
+            for resp in batch:
+                for scraped_url in self._scrape(resp):
+                    if self.robots_cache.can_fetch(scraped_url):
+                        self._add_url(scraped_url)
+            batch = next_batch
+        self.parse_pool.shutdown()
+        self.page_store.close()
+        self.crawl_stats.flush()
+        self.logger.info(
+            f"Replayed {self.crawl_stats.stats['total_pages']} pages, "
+            f"{self.crawl_stats.stats['total_urls']} urls.")
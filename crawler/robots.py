@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import urllib.robotparser
+
+from threading import RLock, Lock, Event
+from urllib.parse import urlparse
+
+from utils import get_logger, get_host
+from utils.download import download
+
+
+class RobotsCache(object):
+    '''
+    Process-wide cache of parsed robots.txt rules, shared by all workers.
+    Each host's robots.txt is downloaded once per ttl seconds; threads that
+    ask for a host while it is being downloaded wait for that download.
+    Verdicts are memoized per (host, path), and the robots.txt contents are
+    saved next to the frontier save file every save_interval seconds (the
+    stats CHECKPOINTINTERVAL) while new ones are downloaded, and when the
+    crawler stops, so a restart does not fetch them again.
+    '''
+    max_verdicts_per_host = 10000
+
+    def __init__(self, config, restart):
+        self.logger = get_logger("ROBOTS")
+        self.config = config
+        self.ttl = config.robots_ttl
+        self.save_file = config.save_file + ".robots.json"
+        self.lock = RLock()
+        self.robots = dict()     # host -> (fetch time, robots.txt content, RobotFileParser)
+        self.in_flight = dict()  # host -> Event set once the download finishes
+        self.verdicts = dict()   # host -> {path: can fetch}
+        self.save_lock = Lock()
+        self.save_interval = config.stats_checkpoint_interval
+        self.last_save = time.time()
+        self.hosts_since_save = 0
+
+        if restart and os.path.exists(self.save_file):
+            os.remove(self.save_file)
+        elif not restart:
+            self._load()
+
+    def _parse(self, content):
+        rp = urllib.robotparser.RobotFileParser()
+        rp.parse(content.splitlines())
+        return rp
+
+    def _is_fresh(self, host):
+        entry = self.robots.get(host)
+        return entry is not None and time.time() - entry[0] < self.ttl
+
+    def fetch(self, parsed_url):
+        ''' Download robots.txt for the url's host unless a fresh copy is cached. '''
+        host = get_host(parsed_url.geturl())
+        with self.lock:
+            if self._is_fresh(host):
+                return
+            event = self.in_flight.get(host)
+            owner = event is None
+            if owner:
+                event = self.in_flight[host] = Event()
+        if not owner:
+            event.wait()
+            return
+
+        try:
+            time.sleep(self.config.time_delay) # Add a delay for politeness
+            robots_url = parsed_url.scheme + "://" + parsed_url.netloc + "/robots.txt"
+            resp = download(robots_url, self.config, self.logger)
+            content = resp.raw_response.text if resp.status == 200 and resp.raw_response is not None else ""
+            self.logger.info(f"Downloaded {robots_url}, status <{resp.status}>.")
+            with self.lock:
+                self.robots[host] = (time.time(), content, self._parse(content))
+                self.verdicts.pop(host, None)
+                self.hosts_since_save += 1
+                save_due = time.time() - self.last_save >= self.save_interval
+        finally:
+            with self.lock:
+                del self.in_flight[host]
+            event.set()
+        if save_due:
+            # A killed crawl downloads at most save_interval seconds of robots.txt again
+            self.save(wait=False)
+
+    def can_fetch(self, url_to_check):
+        parsed_url = urlparse(url_to_check)
+        host = get_host(url_to_check)
+        path = parsed_url.path + ("?" + parsed_url.query if parsed_url.query else "")
+        with self.lock:
+            entry = self.robots.get(host)
+            if entry is None:
+                return True
+            host_verdicts = self.verdicts.setdefault(host, dict())
+            if path not in host_verdicts:
+                if len(host_verdicts) >= self.max_verdicts_per_host:
+                    host_verdicts.clear()
+                host_verdicts[path] = entry[2].can_fetch(self.config.user_agent, url_to_check)
+            return host_verdicts[path]
+
+    def save(self, wait=True):
+        # Without wait, nothing is done while another thread is saving.
+        if not self.save_lock.acquire(blocking=wait):
+            return
+        try:
+            with self.lock:
+                self.last_save = time.time()
+                if not self.hosts_since_save and os.path.exists(self.save_file):
+                    return
+                self.hosts_since_save = 0
+                data = {host: [fetch_time, content]
+                        for host, (fetch_time, content, _) in self.robots.items()}
+            tmp_file = self.save_file + ".tmp"
+            with open(tmp_file, "w") as outfile:
+                json.dump(data, outfile)
+            os.replace(tmp_file, self.save_file)
+        finally:
+            self.save_lock.release()
+
+    def _load(self):
+        if not os.path.exists(self.save_file):
+            return
+        with open(self.save_file, "r") as openFile:
+            data = json.load(openFile)
+        for host, (fetch_time, content) in data.items():
+            self.robots[host] = (fetch_time, content, self._parse(content))
+        self.logger.info(f"Loaded robots.txt for {len(self.robots)} hosts from {self.save_file}.")
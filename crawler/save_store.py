@@ -0,0 +1,157 @@
+import os
+import time
+import shelve
+import sqlite3
+
+from utils.metrics import metrics
+
+
+class ShelveSaveStore(object):
+    ''' The original save file: a shelve database flushed on every write. '''
+    def __init__(self, save_file, batch_size=1, flush_interval=0):
+        self.save_file = save_file
+        self.save = shelve.open(save_file)
+
+    def __contains__(self, urlhash):
+        return urlhash in self.save
+
+    def __getitem__(self, urlhash):
+        return self.save[urlhash]
+
+    def __setitem__(self, urlhash, value):
+        self.save[urlhash] = value
+        with metrics.time("save_flush"):
+            self.save.sync()
+
+    def __len__(self):
+        return len(self.save)
+
+    def keys(self):
+        return self.save.keys()
+
+    def values(self):
+        return self.save.values()
+
+    def tbd_urls(self):
+        # Snapshot, the shelve cannot be iterated while it is written to
+        return iter([url for url, completed in self.save.values() if not completed])
+
+    def tbd_count(self):
+        return sum(1 for url, completed in self.save.values() if not completed)
+
+    def flush(self):
+        self.save.sync()
+
+    def close(self):
+        self.save.close()
+
+
+class SqliteSaveStore(object):
+    '''
+    Save file backed by SQLite in WAL mode. Writes are buffered and committed
+    in batches of batch_size urls, or once flush_interval seconds have passed
+    since the last commit. Each batch is one transaction, so a crash loses at
+    most the batch that was not committed yet.
+    '''
+    def __init__(self, save_file, batch_size=100, flush_interval=5.0):
+        self.save_file = save_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Workers share the store through the frontier lock.
+        self.conn = sqlite3.connect(save_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL is still consistent after a crash.
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, completed INTEGER NOT NULL)")
+        self.conn.commit()
+        self.pending = dict()   # urlhash -> (url, completed) not yet committed
+        self.last_flush = time.time()
+
+    def __contains__(self, urlhash):
+        if urlhash in self.pending:
+            return True
+        return self.conn.execute(
+            "SELECT 1 FROM urls WHERE urlhash = ?", (urlhash,)).fetchone() is not None
+
+    def __getitem__(self, urlhash):
+        if urlhash in self.pending:
+            return self.pending[urlhash]
+        row = self.conn.execute(
+            "SELECT url, completed FROM urls WHERE urlhash = ?", (urlhash,)).fetchone()
+        if row is None:
+            raise KeyError(urlhash)
+        return row[0], bool(row[1])
+
+    def __setitem__(self, urlhash, value):
+        self.pending[urlhash] = value
+        if (len(self.pending) >= self.batch_size
+                or time.time() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def __len__(self):
+        self.flush()
+        return self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def keys(self):
+        self.flush()
+        for (urlhash,) in self.conn.execute("SELECT urlhash FROM urls"):
+            yield urlhash
+
+    def values(self):
+        self.flush()
+        for url, completed in self.conn.execute("SELECT url, completed FROM urls"):
+            yield url, bool(completed)
+
+    def tbd_urls(self, page_size=10000):
+        # Read in pages of rows that existed when the iteration started, so
+        # the crawl can write to the save file between pages. Completing a url
+        # replaces its row (new rowid), which drops it from the iteration.
+        self.flush()
+        max_rowid = self.conn.execute("SELECT MAX(rowid) FROM urls").fetchone()[0] or 0
+        last_rowid = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT rowid, url FROM urls WHERE completed = 0 AND rowid > ? AND rowid <= ? "
+                "ORDER BY rowid LIMIT ?", (last_rowid, max_rowid, page_size)).fetchall()
+            if not rows:
+                return
+            for rowid, url in rows:
+                yield url
+            last_rowid = rows[-1][0]
+
+    def tbd_count(self):
+        self.flush()
+        return self.conn.execute("SELECT COUNT(*) FROM urls WHERE completed = 0").fetchone()[0]
+
+    def flush(self):
+        if self.pending:
+            with metrics.time("save_flush"), self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO urls (urlhash, url, completed) VALUES (?, ?, ?)",
+                    [(urlhash, url, int(completed))
+                     for urlhash, (url, completed) in self.pending.items()])
+            self.pending.clear()
+        self.last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+save_stores = {
+    "shelve": ShelveSaveStore,
+    "sqlite": SqliteSaveStore,
+}
+
+def open_save_store(config):
+    store_class = save_stores[config.save_backend]
+    return store_class(
+        config.save_file, config.save_batch_size, config.save_flush_interval)
+
+def remove_save_file(save_file):
+    # SQLite keeps its write-ahead log next to the database file.
+    for path in (save_file, save_file + "-wal", save_file + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,61 @@
+import math
+from urllib.parse import urlparse
+
+from utils import get_host
+
+# Url scorers: each returns a score for a url where lower is crawled first.
+
+def depth(url, parsed):
+    # Number of path segments
+    path = parsed.path.strip("/")
+    return path.count("/") + 1 if path else 0
+
+def path_length(url, parsed):
+    return len(parsed.path) / 10
+
+def query_params(url, parsed):
+    return parsed.query.count("&") + 1 if parsed.query else 0
+
+
+class HostYield(object):
+    ''' Prefers hosts whose pages have added the most new words per fetch so far. '''
+    def __init__(self, crawl_stats):
+        self.crawl_stats = crawl_stats
+
+    def __call__(self, url, parsed):
+        if self.crawl_stats is None:
+            return 0
+        fetches, new_words = self.crawl_stats.host_yield(get_host(url))
+        if not fetches:
+            return 0
+        return -math.log1p(new_words / fetches)
+
+
+scorers = {
+    "depth": lambda crawl_stats: depth,
+    "path_length": lambda crawl_stats: path_length,
+    "query_params": lambda crawl_stats: query_params,
+    "host_yield": HostYield,
+}
+
+class UrlScorer(object):
+    '''
+    Weighted sum of the scorers named in a spec like "depth:1, host_yield:2".
+    An empty spec gives every url the same score, i.e. FIFO order.
+    '''
+    def __init__(self, spec, crawl_stats=None):
+        self.weighted = []
+        for part in spec.split(","):
+            if not part.strip():
+                continue
+            name, _, weight = part.partition(":")
+            name = name.strip()
+            if name not in scorers:
+                raise ValueError(f"Unknown url scorer {name}, choose from {sorted(scorers)}.")
+            self.weighted.append((scorers[name](crawl_stats), float(weight or 1)))
+
+    def __call__(self, url):
+        if not self.weighted:
+            return 0
+        parsed = urlparse(url)
+        return sum(weight * scorer(url, parsed) for scorer, weight in self.weighted)
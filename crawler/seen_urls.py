@@ -0,0 +1,138 @@
+import math
+
+from threading import Lock
+
+
+class BloomFilter(object):
+    ''' Bloom filter over 32-byte sha256 url digests, sized for expected_items. '''
+    def __init__(self, expected_items, false_positive_rate):
+        self.size = max(64, int(-expected_items * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / expected_items * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest):
+        # Double hashing with two independent halves of the digest
+        h1 = int.from_bytes(digest[16:24], "little")
+        h2 = int.from_bytes(digest[24:32], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hash_count)]
+
+    def add(self, digest):
+        bits = self.bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest):
+        bits = self.bits
+        for position in self._positions(digest):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def expected_false_positive_rate(self):
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+
+class DigestSet(object):
+    '''
+    Set of 16-byte digests stored in one bytearray as an open addressing
+    hash table with linear probing, about 32 bytes per digest instead of
+    roughly 150 for a Python set of 64-character hex strings.
+    '''
+    digest_size = 16
+    empty = bytes(16)
+
+    def __init__(self, capacity=1024):
+        self.capacity = 1 << max(4, (capacity - 1).bit_length())
+        self.table = bytearray(self.capacity * self.digest_size)
+        self.count = 0
+
+    def _slot(self, digest):
+        # Returns the slot holding digest, or the empty slot where it would go
+        mask = self.capacity - 1
+        slot = int.from_bytes(digest[:8], "little") & mask
+        table = self.table
+        size = self.digest_size
+        while True:
+            start = slot * size
+            stored = table[start:start + size]
+            if stored == digest or stored == self.empty:
+                return start, stored == digest
+            slot = (slot + 1) & mask
+
+    def __contains__(self, digest):
+        return self._slot(digest[:self.digest_size])[1]
+
+    def add(self, digest):
+        digest = digest[:self.digest_size]
+        start, found = self._slot(digest)
+        if not found:
+            self.table[start:start + self.digest_size] = digest
+            self.count += 1
+            if self.count * 10 > self.capacity * 7:
+                self._grow()
+
+    def _grow(self):
+        old_table = self.table
+        size = self.digest_size
+        self.capacity *= 2
+        self.table = bytearray(self.capacity * size)
+        self.count = 0
+        for start in range(0, len(old_table), size):
+            digest = bytes(old_table[start:start + size])
+            if digest != self.empty:
+                self.add(digest)
+
+    def memory_bytes(self):
+        return len(self.table)
+
+
+class SeenUrls(object):
+    '''
+    Layered record of the urls discovered so far. A Bloom filter answers most
+    lookups for new urls without touching anything else. Possible positives are
+    checked in an in-memory set of 16-byte digests, which holds every url
+    discovered so far (the frontier loads the save file into it on start), so
+    the save file itself is never read.
+    '''
+    def __init__(self, expected_urls, false_positive_rate):
+        self.lock = Lock()
+        self.bloom = BloomFilter(expected_urls, false_positive_rate)
+        self.digests = DigestSet()
+        self.lookups = 0
+        self.bloom_negatives = 0
+        self.false_positives = 0
+
+    def add(self, digest):
+        with self.lock:
+            self.bloom.add(digest)
+            self.digests.add(digest)
+
+    def seen(self, digest):
+        ''' True if the url with this sha256 digest was discovered before. '''
+        with self.lock:
+            self.lookups += 1
+            if digest not in self.bloom:
+                self.bloom_negatives += 1
+                return False
+            if digest in self.digests:
+                return True
+            # Bloom filter false positive
+            self.false_positives += 1
+            return False
+
+    def report(self):
+        with self.lock:
+            # Lookups of urls that were not in the digest set
+            new_urls = self.bloom_negatives + self.false_positives
+            observed_rate = self.false_positives / new_urls if new_urls else 0.0
+            return {
+                "urls": self.digests.count,
+                "bloom_bytes": len(self.bloom.bits),
+                "digest_set_bytes": self.digests.memory_bytes(),
+                "expected_false_positive_rate": self.bloom.expected_false_positive_rate(),
+                "observed_false_positive_rate": observed_rate,
+                "false_positives": self.false_positives,
+            }
@@ -0,0 +1,173 @@
+import os
+import time
+import bisect
+import hashlib
+
+from utils import get_host
+
+
+class HashRing(object):
+    '''
+    Consistent hashing of hosts onto shard_count shards. Every shard has
+    replicas points on a ring of 64-bit hashes and a host belongs to the
+    shard of the first point after the host's hash, so hosts are spread
+    evenly and changing the number of shards only moves about 1/N of them.
+    '''
+    def __init__(self, shard_count, replicas=64):
+        self.shard_count = shard_count
+        points = sorted(
+            (self._hash(f"shard-{shard}-{replica}"), shard)
+            for shard in range(shard_count) for replica in range(replicas))
+        self.points = [point for point, shard in points]
+        self.shards = [shard for point, shard in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def shard_of(self, host):
+        index = bisect.bisect(self.points, self._hash(host)) % len(self.points)
+        return self.shards[index]
+
+
+class DirectoryInbox(object):
+    '''
+    Exchanges urls between shards on one machine or a shared file system.
+    Every shard reads the batch files dropped in its own directory. A sender
+    writes a batch to a hidden temporary file and renames it, so a reader
+    never sees a partial batch.
+
+    Every shard publishes a generation (shard-i.generation) that changes
+    when it is started with restart and is kept when it resumes, and names
+    its batches with it. A batch whose sender has since started a new
+    generation belongs to an earlier crawl and is deleted unread; batches of
+    the current crawl are kept even if they were sent before this shard
+    started, since their sender already marked the urls as seen.
+    '''
+    def __init__(self, directory, shard_index, shard_count, restart=False):
+        self.directory = directory
+        self.shard_index = shard_index
+        self.sequence = 0
+        self.stale_batches = 0
+        for shard in range(shard_count):
+            os.makedirs(self._shard_directory(shard), exist_ok=True)
+        self.generation = self._start_generation(restart)
+
+    def _shard_directory(self, shard):
+        return os.path.join(self.directory, f"shard-{shard}")
+
+    def _generation_path(self, shard):
+        return os.path.join(self.directory, f"shard-{shard}.generation")
+
+    def _start_generation(self, restart):
+        path = self._generation_path(self.shard_index)
+        if not restart:
+            generation = self._published_generation(self.shard_index)
+            if generation:
+                return generation
+        generation = time.time_ns()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as generation_file:
+            generation_file.write(str(generation))
+        os.replace(tmp_path, path)
+        return generation
+
+    def _published_generation(self, shard):
+        try:
+            with open(self._generation_path(shard), "r") as generation_file:
+                return int(generation_file.read())
+        except (OSError, ValueError):
+            return 0
+
+    def send(self, shard, urls):
+        self.sequence += 1
+        name = f"{self.shard_index}-{self.generation}-{os.getpid()}-{self.sequence}.urls"
+        tmp_path = os.path.join(self._shard_directory(shard), "." + name)
+        with open(tmp_path, "w", encoding="utf-8") as batch_file:
+            batch_file.write("\n".join(urls) + "\n")
+        os.replace(tmp_path, os.path.join(self._shard_directory(shard), name))
+
+    def receive(self):
+        urls = list()
+        with os.scandir(self._shard_directory(self.shard_index)) as entries:
+            names = [entry.name for entry in entries if not entry.name.startswith(".")]
+        generations = dict()    # sender -> its generation now
+        for name in names:
+            path = os.path.join(self._shard_directory(self.shard_index), name)
+            parts = name.split("-")
+            sender = int(parts[0]) if parts[0].isdigit() else -1
+            # 0 for a batch named without a generation, by an older crawler
+            generation = int(parts[1]) if len(parts) == 4 and parts[1].isdigit() else 0
+            if sender not in generations:
+                generations[sender] = self._published_generation(sender)
+            if not generation or generation < generations[sender]:
+                self.stale_batches += 1
+            else:
+                with open(path, "r", encoding="utf-8") as batch_file:
+                    urls.extend(batch_file.read().splitlines())
+            os.remove(path)
+        return urls
+
+
+class ShardRouter(object):
+    '''
+    Decides which shard owns a url and buffers the urls of other shards.
+    Buffered urls are sent in batches of batch_size, or once flush_interval
+    seconds have passed. The shard's own inbox is read at most every
+    flush_interval seconds.
+    '''
+    def __init__(self, config, restart=False):
+        self.shard_index = config.shard_index
+        self.ring = HashRing(config.shard_count)
+        self.inbox = DirectoryInbox(config.shard_inbox, config.shard_index, config.shard_count, restart)
+        self.batch_size = config.shard_batch_size
+        self.flush_interval = config.shard_flush_interval
+        self.idle_timeout = config.shard_idle_timeout
+        self.outboxes = dict()      # shard -> urls not sent yet
+        self.last_flush = time.time()
+        self.last_poll = 0
+        self.last_activity = time.time()
+        self.forwarded = 0
+        self.received = 0
+
+    def owns(self, url):
+        return self.ring.shard_of(get_host(url)) == self.shard_index
+
+    def forward(self, url):
+        shard = self.ring.shard_of(get_host(url))
+        outbox = self.outboxes.setdefault(shard, list())
+        outbox.append(url)
+        self.forwarded += 1
+        if len(outbox) >= self.batch_size:
+            self.inbox.send(shard, outbox)
+            del self.outboxes[shard]
+        elif time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        for shard, outbox in self.outboxes.items():
+            self.inbox.send(shard, outbox)
+        self.outboxes.clear()
+        self.last_flush = time.time()
+
+    def exchange(self):
+        # Sends the buffered urls and returns the urls other shards sent here,
+        # at most once every flush_interval seconds.
+        now = time.time()
+        if now - self.last_poll < self.flush_interval:
+            return []
+        self.last_poll = now
+        if self.outboxes:
+            self.flush()
+        urls = self.inbox.receive()
+        if urls:
+            self.received += len(urls)
+            self.touch()
+        return urls
+
+    def touch(self):
+        self.last_activity = time.time()
+
+    def idle(self):
+        # True once nothing was crawled or received for idle_timeout seconds.
+        return time.time() - self.last_activity >= self.idle_timeout
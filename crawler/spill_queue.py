@@ -0,0 +1,65 @@
+import os
+import shutil
+
+
+class SpillFiles(object):
+    '''
+    FIFO of urls kept on disk in numbered segment files of up to segment_size
+    urls each. Urls are appended to the newest segment and read back one whole
+    segment at a time, oldest first. The segments only hold urls that are also
+    recorded as not completed in the save file, so they are cleared on startup.
+    '''
+    def __init__(self, directory, segment_size):
+        self.directory = directory
+        self.segment_size = segment_size
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        self.first_segment = 0      # Oldest segment not read yet
+        self.last_segment = 0       # Segment being written
+        self.last_segment_count = 0
+        self.writer = None
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:06d}.txt")
+
+    def append(self, url):
+        if self.writer is None:
+            self.writer = open(self._segment_path(self.last_segment), "a", encoding="utf-8")
+        self.writer.write(url + "\n")
+        self.last_segment_count += 1
+        self.count += 1
+        if self.last_segment_count >= self.segment_size:
+            self._close_segment()
+
+    def _close_segment(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.last_segment += 1
+        self.last_segment_count = 0
+
+    def read_segment(self):
+        ''' Removes and returns the urls of the oldest segment. '''
+        if not self.count:
+            return []
+        if self.first_segment == self.last_segment:
+            # Only the segment being written is left
+            self._close_segment()
+        path = self._segment_path(self.first_segment)
+        with open(path, "r", encoding="utf-8") as segment_file:
+            urls = segment_file.read().splitlines()
+        os.remove(path)
+        self.first_segment += 1
+        self.count -= len(urls)
+        return urls
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        shutil.rmtree(self.directory, ignore_errors=True)
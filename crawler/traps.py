@@ -0,0 +1,135 @@
+import re
+
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from urllib.parse import urlsplit
+
+from utils import get_logger, get_host
+
+# Path segments that only differ by dates or numbers belong to the same template,
+# e.g. /events/2024-05-01/page/3 and /events/2023-11-30/page/12
+date_pattern = re.compile(r"\d{4}[-_/]\d{1,2}(?:[-_/]\d{1,2})?|(?:19|20)\d{6}")
+number_pattern = re.compile(r"\d+")
+
+@lru_cache(maxsize=65536)
+def url_template(url):
+    # Returns the host, the path template and the highest number of times a
+    # single segment repeats in the path.
+    parsed = urlsplit(url)
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    template = "/" + "/".join(
+        number_pattern.sub("<n>", date_pattern.sub("<date>", segment)) for segment in segments)
+    if parsed.query:
+        # Keep the parameter names only
+        names = sorted({param.partition("=")[0] for param in parsed.query.split("&")})
+        template += "?" + "&".join(names)
+    repeats = max((segments.count(segment) for segment in set(segments)), default=0)
+    return get_host(url), template, repeats
+
+
+class TrapStats(object):
+    ''' Counts for one host or path template. '''
+    __slots__ = ("urls", "pages", "low_yield_pages", "banned")
+
+    def __init__(self):
+        self.urls = 0               # Unique urls discovered
+        self.pages = 0              # Pages downloaded
+        self.low_yield_pages = 0    # Pages that were duplicates, errors or nearly empty
+        self.banned = False
+
+    def low_yield(self, min_samples, low_yield_ratio):
+        return (self.pages >= min_samples
+                and self.low_yield_pages >= low_yield_ratio * self.pages)
+
+
+class TrapDetector(object):
+    '''
+    Online crawler trap detection. The frontier asks admit() about every new
+    url and the scraper reports every downloaded page with record_page().
+    Urls are grouped by host and by path template (numbers and dates
+    collapsed, query values dropped). A url is rejected when one path segment
+    repeats more than max_repeats times. A template that keeps producing new
+    urls is throttled to one url in every throttle_every past template_limit,
+    and a template (or host) whose pages are mostly low yield is banned (or
+    throttled). At most max_templates templates and hosts are tracked, the
+    least recently used are forgotten first, and every call is O(1) in the
+    number of urls seen.
+    '''
+    def __init__(self, config):
+        self.logger = get_logger("TRAPS")
+        self.max_repeats = config.trap_max_repeats
+        self.template_limit = config.trap_template_limit
+        self.throttle_every = config.trap_throttle_every
+        self.min_samples = config.trap_min_samples
+        self.low_yield_ratio = config.trap_low_yield_ratio
+        self.min_words = config.trap_min_words
+        self.max_templates = config.trap_max_templates
+        self.lock = Lock()
+        self.templates = OrderedDict()  # (host, template) -> TrapStats
+        self.hosts = OrderedDict()      # host -> TrapStats
+        self.rejected = 0
+
+    def _stats(self, table, key):
+        # Must be called with self.lock held.
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = TrapStats()
+            if len(table) > self.max_templates:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return stats
+
+    def admit(self, url):
+        ''' Returns whether a newly discovered url should be crawled. '''
+        host, template, repeats = url_template(url)
+        with self.lock:
+            if repeats > self.max_repeats:
+                self.rejected += 1
+                return False
+            template_stats = self._stats(self.templates, (host, template))
+            host_stats = self._stats(self.hosts, host)
+            template_stats.urls += 1
+            host_stats.urls += 1
+            if template_stats.banned:
+                self.rejected += 1
+                return False
+            # Past the limit (or on a low yield host) only every throttle_every-th url is kept
+            throttled = (template_stats.urls > self.template_limit
+                         or host_stats.low_yield(self.min_samples, self.low_yield_ratio))
+            if throttled and template_stats.urls % self.throttle_every:
+                self.rejected += 1
+                return False
+            return True
+
+    def is_banned(self, url):
+        host, template, repeats = url_template(url)
+        with self.lock:
+            template_stats = self.templates.get((host, template))
+            return template_stats is not None and template_stats.banned
+
+    def record_page(self, url, word_count=0):
+        # word_count is 0 for errors, duplicates and pages that were not parsed.
+        host, template, repeats = url_template(url)
+        low_yield = word_count < self.min_words
+        with self.lock:
+            template_stats = self._stats(self.templates, (host, template))
+            for stats in (template_stats, self._stats(self.hosts, host)):
+                stats.pages += 1
+                if low_yield:
+                    stats.low_yield_pages += 1
+            if (not template_stats.banned
+                    and template_stats.low_yield(self.min_samples, self.low_yield_ratio)):
+                template_stats.banned = True
+                self.logger.info(
+                    f"Banned {host}{template} after {template_stats.low_yield_pages} "
+                    f"low yield pages out of {template_stats.pages}.")
+
+    def report(self):
+        with self.lock:
+            return {
+                "templates": len(self.templates),
+                "banned_templates": sum(1 for stats in self.templates.values() if stats.banned),
+                "rejected_urls": self.rejected,
+            }
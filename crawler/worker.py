@@ -3,19 +3,23 @@ from threading import Thread
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.log_queue import log_pipeline
+from utils.metrics import metrics
 import scraper
-import time
 
-import urllib.robotparser
 from urllib.parse import urlparse
 
 class Worker(Thread):
-    def __init__(self, worker_id, config, frontier, crawl_stats=None):
+    def __init__(self, worker_id, config, frontier, crawl_stats=None, robots_cache=None, parse_pool=None, duplicates=None,
+                 page_store=None):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
-        self.robots_txts = {} # The robots.txt content for each encountered domain/subdomain
+        self.robots_cache = robots_cache # Parsed robots.txt rules shared by all workers
         self.crawl_stats = crawl_stats
+        self.parse_pool = parse_pool # Optional process pool used by the scraper to parse pages
+        self.duplicates = duplicates # Fingerprints of the pages seen so far
+        self.page_store = page_store # Optional store of every downloaded page
 
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
@@ -24,48 +28,54 @@ class Worker(Thread):
         
     def run(self):
         while True:
-            tbd_url = self.frontier.get_tbd_url()
+            with metrics.time("frontier_wait"):
+                tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
+            try:
+                self.process(tbd_url)
+            except Exception:
+                # One bad page must not kill the worker: its host would stay busy forever.
+                self.logger.exception(f"Error processing {tbd_url}, skipped.")
+            finally:
+                # The frontier holds this host back for config.time_delay after
+                # completion, so other hosts can be crawled in the meantime.
+                with metrics.time("mark_complete"):
+                    self.frontier.mark_url_complete(tbd_url)
+
+    def process(self, tbd_url):
+        with metrics.time("download"):
             resp = download(tbd_url, self.config, self.logger)
+        metrics.count_fetch(tbd_url)
+        if self.page_store is not None:
+            self.page_store.put(tbd_url, resp)
+        # Only a sample of the successful downloads is logged, failures always are
+        if resp.status != 200:
+            self.logger.info(
+                f"Downloaded {tbd_url}, status <{resp.status}>, error {resp.error}, "
+                f"using cache {self.config.cache_server}.")
+        elif log_pipeline.sample_url():
             self.logger.info(
                 f"Downloaded {tbd_url}, status <{resp.status}>, "
                 f"using cache {self.config.cache_server}.")
-            
-            # Download robots.txt if domain/subdomain has not been seen yet
-            parsed_url = urlparse(tbd_url)
-            domain = parsed_url.netloc.replace("www.", "")
-            if domain not in self.robots_txts:
-                time.sleep(self.config.time_delay) # Add a delay for politeness
-                robots_content = self.get_robots_txt_content(parsed_url)
-                self.robots_txts[domain] = robots_content
-            
-            scraped_urls = scraper.scraper(tbd_url, resp, self.crawl_stats)
+        
+        # Download robots.txt if domain/subdomain has not been seen yet
+        if self.robots_cache is not None:
+            with metrics.time("robots"):
+                self.robots_cache.fetch(urlparse(tbd_url))
+        
+        with metrics.time("scrape"):
+            scraped_urls = scraper.scraper(
+                tbd_url, resp, self.crawl_stats, self.parse_pool, self.duplicates,
+                getattr(self.frontier, "traps", None))
+        # One timer for all the links, can_fetch and add_url are too quick to time one by one
+        with metrics.time("add_links"):
             for scraped_url in scraped_urls:
                 if self.can_fetch(scraped_url):
                     self.frontier.add_url(scraped_url)
 
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay) # Add a delay for politeness
-
-    def get_robots_txt_content(self, parsed_url):
-        robots_url = parsed_url.scheme + "://" + parsed_url.netloc + "/robots.txt"
-        print(robots_url)
-        resp = download(robots_url, self.config, self.logger)
-
-        if resp.status == 200:
-            print(resp.raw_response.text)
-            return resp.raw_response.text
-        return ""
-    
     def can_fetch(self, url_to_check):
-        parsed_url = urlparse(url_to_check)
-        domain = parsed_url.netloc.replace("www.", "")
-
-        if domain in self.robots_txts:
-            robots_content = self.robots_txts[domain]
-            rp = urllib.robotparser.RobotFileParser()
-            rp.parse(robots_content.splitlines())
-            return rp.can_fetch(self.config.user_agent, url_to_check)
+        if self.robots_cache is not None:
+            return self.robots_cache.can_fetch(url_to_check)
         return True
@@ -0,0 +1,309 @@
+import re
+import codecs
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin
+
+from bs4 import BeautifulSoup, UnicodeDammit
+from bs4.dammit import EncodingDetector, EntitySubstitution
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Strings inside these tags are not part of the page text (same as BeautifulSoup.get_text)
+hidden_text_tags = frozenset(["script", "style", "template", "rt", "rp"])
+# Whitespace-only strings inside these tags are kept as they are
+preserve_whitespace_tags = frozenset(["pre", "textarea"])
+# Tags that never have content, so they are closed as soon as they are opened
+empty_element_tags = frozenset([
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed",
+    "frame", "hr", "image", "img", "input", "isindex", "keygen", "link",
+    "menuitem", "meta", "nextid", "param", "source", "spacer", "track", "wbr"])
+ascii_spaces = " \n\t\x0c\r"
+decimal_reference_pattern = re.compile("^([0-9]+)(.*)")
+hex_reference_pattern = re.compile("^([0-9a-f]+)(.*)")
+
+
+def resolve_links(url, hrefs, base_href=None):
+    # Honor <base href>, which is itself relative to the page url
+    base_url = urljoin(url, base_href) if base_href else url
+    links = []
+    for extracted_url in hrefs:
+        # Defragment the URL
+        extracted_url = urldefrag(extracted_url).url
+
+        # Ensure the URL is absolute. Handles cases where URL may be relative by joining it with the base url
+        extracted_url = urljoin(base_url, extracted_url)
+
+        links.append(extracted_url)
+    return links
+
+
+def decode_markup(content):
+    # Page bytes (or a memoryview of them) to text, with the encoding
+    # BeautifulSoup would pick. Pages that declare UTF-8 are decoded straight
+    # from the buffer; any other (or no) declared charset goes through
+    # UnicodeDammit like BeautifulSoup does, so a page that declares
+    # iso-8859-1 is read as iso-8859-1 even if its bytes are valid UTF-8.
+    if isinstance(content, str):
+        return content
+    if declared_encoding(content) == "utf-8":
+        try:
+            return str(content, "utf-8-sig")
+        except UnicodeDecodeError:
+            pass
+    return UnicodeDammit(bytes(content), is_html=True).unicode_markup or ""
+
+
+def declared_encoding(content):
+    # The <?xml?> or <meta> charset, searched in as much of the page as
+    # BeautifulSoup searches, normalized to its codec name
+    prefix = bytes(content[:max(2048, int(len(content) * 0.05))])
+    declared = EncodingDetector.find_declared_encoding(prefix, is_html=True)
+    try:
+        return codecs.lookup(declared).name if declared else None
+    except LookupError:
+        return None
+
+
+def extract_bs4(url, content):
+    # Builds the full DOM with BeautifulSoup
+    if isinstance(content, memoryview):
+        content = content.tobytes()
+    soup = BeautifulSoup(content, 'html.parser')
+    # Process page to get page statistics
+    # Source: https://realpython.com/python-web-scraping-practical-introduction/
+    text_content = soup.get_text()
+
+    # Source: https://medium.com/@spaw.co/extracting-all-links-using-beautifulsoup-in-python-a96786508659
+    hrefs = [a_tag.get('href') for a_tag in soup.find_all('a', href=True)]
+    base_tag = soup.find('base', href=True)
+    return resolve_links(url, hrefs, base_tag.get('href') if base_tag else None), text_content
+
+
+class LinkTextParser(HTMLParser):
+    '''
+    Streaming parser that collects the hrefs of <a> tags, the first
+    <base href> and the visible text in one pass. Instead of a tree it only
+    keeps the stack of open tag names, and it follows the same rules as
+    BeautifulSoup's html.parser builder (entity decoding, closing tags,
+    whitespace-only strings) so the text matches BeautifulSoup.get_text().
+    '''
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.hrefs = []
+        self.base_href = None
+        self.text = []
+        self.current_data = []          # Pieces of the string being read
+        self.open_tags = []
+        self.hidden = 0                 # Open tags in hidden_text_tags
+        self.preserve_whitespace = 0    # Open tags in preserve_whitespace_tags
+        self.already_closed = []        # Empty element tags closed before their end tag
+
+    def end_data(self, is_text=None):
+        # A string ends at every tag, comment or declaration.
+        if self.current_data:
+            data = "".join(self.current_data)
+            self.current_data = []
+            if not self.preserve_whitespace and not data.strip(ascii_spaces):
+                data = "\n" if "\n" in data else " "
+            if is_text if is_text is not None else not self.hidden:
+                self.text.append(data)
+
+    def push_tag(self, tag):
+        self.open_tags.append(tag)
+        if tag in hidden_text_tags:
+            self.hidden += 1
+        if tag in preserve_whitespace_tags:
+            self.preserve_whitespace += 1
+
+    def pop_to_tag(self, tag):
+        # Close the most recent open tag with this name and every tag opened after it
+        if tag not in self.open_tags:
+            return
+        while True:
+            popped = self.open_tags.pop()
+            if popped in hidden_text_tags:
+                self.hidden -= 1
+            if popped in preserve_whitespace_tags:
+                self.preserve_whitespace -= 1
+            if popped == tag:
+                break
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self.end_data()
+        if tag == "a" or tag == "base":
+            href = None
+            for name, value in attrs:
+                if name == "href":
+                    # Last duplicate attribute wins, valueless attribute is ""
+                    href = value if value is not None else ""
+            if href is not None:
+                if tag == "a":
+                    self.hrefs.append(href)
+                elif self.base_href is None:
+                    self.base_href = href
+        self.push_tag(tag)
+        if handle_empty_element and tag in empty_element_tags:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed:
+            # Redundant end tag of an empty element tag, e.g. <br></br>
+            self.already_closed.remove(tag)
+        else:
+            self.end_data()
+            self.pop_to_tag(tag)
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else "&" + name)
+
+    def handle_charref(self, name):
+        if name[:1] in ("x", "X"):
+            base, number, pattern = 16, name[1:], hex_reference_pattern
+        else:
+            base, number, pattern = 10, name, decimal_reference_pattern
+        character, extra_data = "", ""
+        try:
+            character = numeric_character(int(number, base))
+        except ValueError:
+            # A reference without a semicolon may be followed by normal text
+            match = pattern.search(number)
+            if match is not None:
+                character = numeric_character(int(match.group(1), base))
+                extra_data = match.group(2)
+            else:
+                extra_data = number
+        self.handle_data(character)
+        self.handle_data(extra_data)
+
+    def handle_comment(self, data):
+        self.end_data()
+
+    def handle_decl(self, decl):
+        self.end_data()
+
+    def handle_pi(self, data):
+        self.end_data()
+
+    def unknown_decl(self, data):
+        self.end_data()
+        # CDATA sections are text (even inside hidden tags), other declarations are not
+        if data.upper().startswith("CDATA["):
+            self.handle_data(data[6:])
+            self.end_data(is_text=True)
+
+
+def numeric_character(codepoint):
+    # Resolve a numeric character reference like BeautifulSoup does.
+    if hasattr(UnicodeDammit, "numeric_character_reference"):
+        return UnicodeDammit.numeric_character_reference(codepoint)[0]
+    try:
+        return chr(codepoint) if codepoint else "\N{REPLACEMENT CHARACTER}"
+    except (ValueError, OverflowError):
+        return "\N{REPLACEMENT CHARACTER}"
+
+
+def extract_stream(url, content):
+    # Same decoding as BeautifulSoup, then a single streaming pass
+    markup = decode_markup(content)
+    parser = LinkTextParser()
+    parser.feed(markup)
+    parser.close()
+    parser.end_data()
+    return resolve_links(url, parser.hrefs, parser.base_href), "".join(parser.text)
+
+
+class LxmlTarget(object):
+    '''
+    lxml parser target with the same callbacks as LinkTextParser. libxml2
+    hands over a string in several pieces, so they are joined and
+    whitespace-only strings are collapsed when the string ends, as
+    LinkTextParser.end_data does.
+    '''
+    def __init__(self):
+        self.hrefs = []
+        self.base_href = None
+        self.text = []
+        self.current_data = []
+        self.hidden = 0
+        self.preserve_whitespace = 0
+
+    def end_data(self):
+        if self.current_data:
+            data = "".join(self.current_data)
+            self.current_data = []
+            if not self.preserve_whitespace and not data.strip(ascii_spaces):
+                data = "\n" if "\n" in data else " "
+            if not self.hidden:
+                self.text.append(data)
+
+    def start(self, tag, attrib):
+        self.end_data()
+        if tag == "a" and "href" in attrib:
+            self.hrefs.append(attrib["href"])
+        elif tag == "base" and "href" in attrib and self.base_href is None:
+            self.base_href = attrib["href"]
+        if tag in hidden_text_tags:
+            self.hidden += 1
+        if tag in preserve_whitespace_tags:
+            self.preserve_whitespace += 1
+
+    def end(self, tag):
+        self.end_data()
+        if tag in hidden_text_tags:
+            self.hidden -= 1
+        if tag in preserve_whitespace_tags:
+            self.preserve_whitespace -= 1
+
+    def data(self, data):
+        self.current_data.append(data)
+
+    def comment(self, text):
+        self.end_data()
+
+    def pi(self, target, data=None):
+        self.end_data()
+
+    def doctype(self, name, public_id, system_url):
+        self.end_data()
+
+    def close(self):
+        self.end_data()
+        return self
+
+
+def extract_lxml(url, content):
+    # libxml2's HTML parser in streaming (target) mode, no tree is built. The
+    # page is decoded like BeautifulSoup does and handed over as UTF-8 bytes
+    # with the encoding given, so libxml2 neither detects the encoding again
+    # nor rejects a str with an <?xml encoding=...?> declaration.
+    markup = decode_markup(content) or "<html/>"
+    parser = etree.HTMLParser(target=LxmlTarget(), encoding="utf-8")
+    target = etree.fromstring(markup.encode("utf-8", "replace"), parser)
+    return resolve_links(url, target.hrefs, target.base_href), "".join(target.text)
+
+
+extractors = {
+    "bs4": extract_bs4,
+    "stream": extract_stream,
+}
+if etree is not None:
+    extractors["lxml"] = extract_lxml
+
+def extract(url, content, backend="stream"):
+    # Returns the absolute links and the text of the page using the given backend.
+    if backend not in extractors:
+        raise ValueError(f"Unknown or unavailable extractor backend {backend}, "
+                         f"choose one of {sorted(extractors)}.")
+    return extractors[backend](url, content)
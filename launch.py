@@ -1,23 +1,52 @@
-from configparser import ConfigParser
-from argparse import ArgumentParser
-
-from utils.server_registration import get_cache_server
-from utils.config import Config
-from crawler import Crawler
-
-
-def main(config_file, restart):
-    cparser = ConfigParser()
-    cparser.read(config_file)
-    config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
-    crawler.start()
-
-
-if __name__ == "__main__":
-    parser = ArgumentParser()
-    parser.add_argument("--restart", action="store_true", default=False)
-    parser.add_argument("--config_file", type=str, default="config.ini")
-    args = parser.parse_args()
-    main(args.config_file, args.restart)
+import sys
+
+from configparser import ConfigParser
+from argparse import ArgumentParser
+
+from utils.config import Config
+from crawler import Crawler
+from crawler.async_engine import AsyncCrawler
+from crawler.replay import Replay
+
+
+def main(config_file, restart, engine=None, shard=None, cache_server=None, replay=False):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    if engine:
+        config.engine = engine
+    if shard:
+        config.set_shard(shard)
+    if replay:
+        # Scraper and statistics over the saved pages, no cache server needed
+        if not config.page_store:
+            sys.exit("Nothing to replay: set PAGESTORE in config.ini to the page store of a crawl.")
+        Replay(config).start()
+        return
+    if cache_server:
+        # Use the given server (e.g. python -m utils.mock_server) without registering
+        host, port = cache_server.rsplit(":", 1)
+        config.cache_server = (host, int(port))
+    else:
+        from utils.server_registration import get_cache_server
+        config.cache_server = get_cache_server(config, restart)
+    if config.engine == "async":
+        crawler = AsyncCrawler(config, restart)
+    else:
+        crawler = Crawler(config, restart)
+    crawler.start()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--restart", action="store_true", default=False)
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", type=str, choices=["threaded", "async"], default=None)
+    # Crawl only the hosts of shard i out of N, e.g. --shard 0/3
+    parser.add_argument("--shard", type=str, default=None)
+    # HOST:PORT of a cache server to use instead of registering with spacetime
+    parser.add_argument("--cache_server", type=str, default=None)
+    # Run the scraper and statistics again over the pages saved in PAGESTORE
+    parser.add_argument("--replay", action="store_true", default=False)
+    args = parser.parse_args()
+    main(args.config_file, args.restart, args.engine, args.shard, args.cache_server, args.replay)
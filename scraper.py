@@ -1,136 +1,145 @@
-import re
-from urllib.parse import urlparse, urldefrag, parse_qs, urljoin
-from bs4 import BeautifulSoup
-
-max_size_kb = 2000
-max_query_length = 100
-
-valid_domains = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
-paths_to_avoid = ["events", "event/", "tag/", "seminar-series", "explore/department-seminars", "author/"]
-
-def scraper(url, resp, crawl_stats=None):
-    links = extract_next_links(url, resp, crawl_stats)
-    return [link for link in links if is_valid(link)]
-
-def extract_next_links(url, resp, crawl_stats=None):
-    # Implementation required.
-    # url: the URL that was used to get the page
-    # resp.url: the actual url of the page
-    # resp.status: the status code returned by the server. 200 is OK, you got the page. Other numbers mean that there was some kind of problem.
-    # resp.error: when status is not 200, you can check the error here, if needed.
-    # resp.raw_response: this is where the page actually is. More specifically, the raw_response has two parts:
-    #         resp.raw_response.url: the url, again
-    #         resp.raw_response.content: the content of the page!
-    # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
-    if resp.status >= 200 and resp.status <= 299:
-        # Successful request
-        # Check content is not empty
-        if resp.raw_response.content is None or len(resp.raw_response.content) == 0:
-            return list()
-        
-        # Avoid crawling very large files
-        size_kb = len(resp.raw_response.content) / 1024
-        if (size_kb > max_size_kb):
-            return list()
-        
-        soup = BeautifulSoup(resp.raw_response.content, 'html.parser')
-        links = []
-        # Process page to get page statistics
-        # Source: https://realpython.com/python-web-scraping-practical-introduction/
-        text_content = soup.get_text()
-        # Compute page statistics
-        if crawl_stats is not None:
-            crawl_stats.compute_page_stats(url, text_content)
-        
-        # Source: https://medium.com/@spaw.co/extracting-all-links-using-beautifulsoup-in-python-a96786508659
-        for a_tag in soup.find_all('a', href=True):
-            extracted_url = a_tag.get('href')
-
-            # Defragment the URL
-            extracted_url = urldefrag(extracted_url).url
-
-            # Ensure the URL is absolute. Handles cases where URL may be relative by joining it with the base url
-            extracted_url = urljoin(url, extracted_url)
-
-            links.append(extracted_url)
-
-        return links
-    elif resp.status >= 300 and resp.status <= 399:
-        # Requests should redirect automatically
-        print(resp.error)
-    elif resp.status >= 400 and resp.status <= 599:
-        # Failed to get resource
-        print(resp.error)
-    elif resp.status >= 600 and resp.status <= 606:
-        # Caching specific error. Your crawler is doing something it shouldn't!
-        print(resp.error)
-
-    return list()
-
-def is_valid(url):
-    # Decide whether to crawl this url or not. 
-    # If you decide to crawl it, return True; otherwise return False.
-    # There are already some conditions that return False.
-    try:
-        parsed = urlparse(url)
-        # Check valid scheme
-        if parsed.scheme not in set(["http", "https"]):
-            return False
-        
-        domain = parsed.netloc.replace("www.", "")
-        # Check appropriate root domain
-        valid_subdomain = False
-        for d in valid_domains:
-            if domain == d or domain.endswith("." + d):
-                valid_subdomain = True
-        if not valid_subdomain: return False
-        
-        # Avoid crawler traps
-        # 1. Avoid calendars and other pages that lead to events. Examples:
-        #   https://ics.uci.edu/events/
-        #   https://ics.uci.edu/event/...
-        #   https://ics.uci.edu/seminar-series/distinguished-lectures/
-        # Avoid low information paths. Tag and author paths may lead to articles that can already be accessed elsewhere
-        #   https://ics.uci.edu/tag/...
-        #   https://ics.uci.edu/author/... 
-        url_path = parsed.path.strip("/")
-        for p in paths_to_avoid:
-            if url_path.startswith(p):
-                return False
-
-        # Avoid links with low information value
-        # 1. Certain queries, and long query structures
-        query_string = parsed.query
-        if query_string:
-            # Ignore links with more than two query parameters
-            query_params = parse_qs(parsed.query)
-            if len(query_params) > 2:
-                return False
-                    
-            # Ignore links with filtering or ordering related queries
-            # e.g. See https://ics.uci.edu/people/. This particular path is also filtered out using the robots.txt.
-            for param in query_params.keys():
-                for ignore_param in ("filter", "limit", "order", "sort"):
-                    if param.startswith(ignore_param):
-                        return False
-
-        # 2. Avoid instructor/course links (ics domain and path starts with ~) which can have many non-webpage files or many short web pages
-        # e.g. http://www.ics.uci.edu/~eppstein/pix leads to crawler trap
-        if parsed.path.startswith("/~"):
-            return False
-        
-        # Filter out non-webpage extensions
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4|lif|rle"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|ppsx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|java|php|py|txt|sql|war|apk|rpm"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
-
-    except TypeError:
-        print ("TypeError for ", parsed)
-        raise
+from crawl_stats import count_words
+from extractors import extract
+from utils.simhash import fingerprints
+from utils.url_filter import UrlFilter
+from utils.canonical_url import canonicalize
+from utils.metrics import metrics
+
+max_size_kb = 2000
+max_query_length = 100
+# Link and text extractor: "stream" (single pass, no tree), "bs4" (full BeautifulSoup DOM) or "lxml" if installed
+extractor_backend = "stream"
+
+valid_domains = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
+# Avoid crawler traps
+# 1. Avoid calendars and other pages that lead to events. Examples:
+#   https://ics.uci.edu/events/
+#   https://ics.uci.edu/event/...
+#   https://ics.uci.edu/seminar-series/distinguished-lectures/
+# Avoid low information paths. Tag and author paths may lead to articles that can already be accessed elsewhere
+#   https://ics.uci.edu/tag/...
+#   https://ics.uci.edu/author/... 
+# 2. Instructor/course links (path starts with ~) are always avoided since they can have many non-webpage
+#    files or many short web pages, e.g. http://www.ics.uci.edu/~eppstein/pix leads to crawler trap
+paths_to_avoid = ["events", "event/", "tag/", "seminar-series", "explore/department-seminars", "author/"]
+
+# Avoid links with low information value
+# 1. Links with more than two query parameters
+max_query_params = 2
+# 2. Links with filtering or ordering related queries
+#   e.g. See https://ics.uci.edu/people/. This particular path is also filtered out using the robots.txt.
+ignored_query_params = ["filter", "limit", "order", "sort"]
+
+# Filter out non-webpage extensions
+non_webpage_extensions = [
+    "css", "js", "bmp", "gif", "jpeg", "jpg", "ico",
+    "png", "tiff", "tif", "mid", "mp2", "mp3", "mp4", "lif", "rle",
+    "wav", "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg", "ogv", "pdf",
+    "ps", "eps", "tex", "ppt", "pptx", "ppsx", "doc", "docx", "xls", "xlsx", "names",
+    "data", "dat", "exe", "bz2", "tar", "msi", "bin", "7z", "psd", "dmg", "iso",
+    "epub", "dll", "cnf", "tgz", "sha1",
+    "thmx", "mso", "arff", "rtf", "jar", "csv",
+    "java", "php", "py", "txt", "sql", "war", "apk", "rpm",
+    "rm", "smil", "wmv", "swf", "wma", "zip", "rar", "gz"]
+
+url_filter = UrlFilter(valid_domains, paths_to_avoid, non_webpage_extensions,
+                       max_query_params, ignored_query_params)
+
+def scraper(url, resp, crawl_stats=None, parse_pool=None, duplicates=None, traps=None):
+    links = extract_next_links(url, resp, crawl_stats, parse_pool, duplicates, traps)
+    return filter_urls(links)
+
+def extract_next_links(url, resp, crawl_stats=None, parse_pool=None, duplicates=None, traps=None):
+    # Implementation required.
+    # url: the URL that was used to get the page
+    # resp.url: the actual url of the page
+    # resp.status: the status code returned by the server. 200 is OK, you got the page. Other numbers mean that there was some kind of problem.
+    # resp.error: when status is not 200, you can check the error here, if needed.
+    # resp.raw_response: this is where the page actually is. More specifically, the raw_response has two parts:
+    #         resp.raw_response.url: the url, again
+    #         resp.raw_response.content: the content of the page!
+    # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
+    # traps: optional TrapDetector told how many words every page had (0 when the page was not used)
+    word_count = 0
+    links = list()
+    if resp.status >= 200 and resp.status <= 299:
+        # Successful request
+        # Page bytes as a memoryview, the pickled response is only decoded here
+        content = resp.body
+        # Check content is not empty
+        if len(content) == 0:
+            return record_page(traps, url, word_count, links)
+        
+        # Avoid crawling very large files
+        size_kb = len(content) / 1024
+        if (size_kb > max_size_kb):
+            return record_page(traps, url, word_count, links)
+        
+        stopwords = crawl_stats.stopwords if crawl_stats is not None else frozenset()
+        with metrics.time("parse"):
+            if parse_pool is not None:
+                # Parse and count words in a separate process, off the GIL
+                # (a memoryview cannot be pickled, the bytes are sent instead)
+                links, page_stats, page_fingerprints = parse_pool.submit(
+                    parse_page, url, resp.raw_response.content, stopwords).result()
+            else:
+                links, page_stats, page_fingerprints = parse_page(url, content, stopwords)
+        # Canonical forms, each linked page once (nav bars and footers repeat links)
+        links = list(dict.fromkeys(map(canonicalize, links)))
+
+        # Exact and near-duplicate pages are neither counted nor expanded
+        if duplicates is not None and page_fingerprints is not None:
+            with metrics.time("duplicates"):
+                duplicate = duplicates.is_duplicate(*page_fingerprints)
+            if duplicate:
+                metrics.count("duplicate_pages")
+                return record_page(traps, url, word_count, list())
+
+        # Compute page statistics
+        if page_stats is not None:
+            word_count = page_stats[0]
+            if crawl_stats is not None:
+                with metrics.time("stats_merge"):
+                    crawl_stats.merge_page_stats(url, *page_stats)
+        return record_page(traps, url, word_count, links)
+
+    # Nothing to scrape otherwise. 3xx: requests should redirect automatically,
+    # 4xx/5xx: failed to get resource, 600-606: caching specific error (your
+    # crawler is doing something it shouldn't!). The worker logs the status and
+    # error of every failed download.
+    return record_page(traps, url, word_count, links)
+
+def record_page(traps, url, word_count, links):
+    # Reports the page to the trap detector and returns its links.
+    if traps is not None:
+        traps.record_page(url, word_count)
+    return links
+
+def parse_html(url, content):
+    # Returns the absolute links and the text of the page.
+    return extract(url, content, extractor_backend)
+
+def parse_page(url, content, stopwords):
+    # Returns the links, the (word count, word frequencies) and the
+    # (checksum, simhash) of the page, or None for both on an empty page
+    # (the simhash alone is None on a page with almost no words).
+    # Can run in a parse pool process.
+    links, text_content = parse_html(url, content)
+    if not text_content:
+        return links, None, None
+    page_stats = count_words(text_content, stopwords)
+    return links, page_stats, fingerprints(text_content, page_stats[1])
+
+def filter_urls(urls):
+    # Batch version of is_valid
+    return url_filter.filter_urls(urls)
+
+def is_valid(url):
+    # Decide whether to crawl this url or not. 
+    # If you decide to crawl it, return True; otherwise return False.
+    # The rules are compiled once into url_filter (see the rules at the top of this file).
+    try:
+        return url_filter.is_valid(url)
+    except TypeError:
+        print ("TypeError for ", url)
+        raise
@@ -1,35 +1,27 @@
-import os
-import logging
 from hashlib import sha256
 from urllib.parse import urlparse
 
+from utils.canonical_url import canonicalize, canonical_key
+from utils.log_queue import log_pipeline
+
 def get_logger(name, filename=None):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    if not os.path.exists("Logs"):
-        os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
-    fh.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-       "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
-    return logger
+    # Set up once per name. Records are queued and written to the console and
+    # Logs/<filename or name>.log by one background thread (utils/log_queue.py).
+    return log_pipeline.get_logger(name, filename)
+
 
+def get_urldigest(url):
+    # Canonical url without the scheme, so http/https, www./no www.,
+    # index.html and other spellings of one page share a hash.
+    return sha256(canonical_key(url).encode("utf-8")).digest()
 
 def get_urlhash(url):
-    parsed = urlparse(url)
-    # everything other than scheme.
-    return sha256(
-        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
-        f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
+    return get_urldigest(url).hex()
+
+def get_host(url):
+    # Host used for per-domain politeness, "www." and non-"www." share one server.
+    return urlparse(url).netloc.lower().replace("www.", "")
 
 def normalize(url):
-    if url.endswith("/"):
-        return url.rstrip("/")
-    return url
+    # See utils/canonical_url.py
+    return canonicalize(url)
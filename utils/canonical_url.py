@@ -0,0 +1,83 @@
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit
+
+# Characters that never need percent-encoding (RFC 3986 section 2.3)
+unreserved = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+percent_pattern = re.compile(r"%[0-9a-fA-F]{2}")
+default_ports = {"http": "80", "https": "443"}
+index_pages = ("index.html", "index.htm", "index.php")
+
+def _normalize_escape(match):
+    # %7e -> ~ for unreserved characters, %2f -> %2F otherwise
+    char = chr(int(match.group(0)[1:], 16))
+    return char if char in unreserved else match.group(0).upper()
+
+def _remove_dot_segments(path):
+    if "." not in path:
+        return path
+    segments = []
+    for segment in path.split("/"):
+        if segment == "..":
+            if len(segments) > 1:
+                segments.pop()
+        elif segment != ".":
+            segments.append(segment)
+    if path.endswith(("/.", "/..")):
+        segments.append("")
+    return "/".join(segments)
+
+@lru_cache(maxsize=65536)
+def canonicalize(url):
+    '''
+    Canonical form of a url, in one urlsplit: lowercase scheme and host,
+    no default port, no fragment, no "." or ".." path segments, escapes of
+    unreserved characters decoded and the other escapes in uppercase, query
+    parameters sorted, and no trailing slash (like the old normalize).
+    The canonical url still points to the same page and is what gets fetched.
+    '''
+    try:
+        parsed = urlsplit(url.strip())
+    except ValueError:
+        return url
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc
+    userinfo, at, hostport = netloc.rpartition("@")
+    host, colon, port = hostport.rpartition(":") if not hostport.endswith("]") else (hostport, "", "")
+    if not colon:
+        host, port = hostport, ""
+    host = host.lower().rstrip(".")
+    if port == default_ports.get(scheme):
+        port = ""
+    netloc = userinfo + at + host + (":" + port if port else "")
+
+    path = parsed.path
+    if "%" in path:
+        path = percent_pattern.sub(_normalize_escape, path)
+    path = _remove_dot_segments(path)
+    query = parsed.query
+    if query:
+        if "%" in query:
+            query = percent_pattern.sub(_normalize_escape, query)
+        query = "&".join(sorted(param for param in query.split("&") if param))
+    canonical = urlunsplit((scheme, netloc, path, query, ""))
+    return canonical.rstrip("/") if canonical.endswith("/") else canonical
+
+@lru_cache(maxsize=65536)
+def canonical_key(url):
+    '''
+    What two urls must share to be the same page: the canonical url without
+    the scheme, with "www." and "index.html" (or .htm, .php) dropped and
+    without a trailing slash. Only used for hashing, never fetched.
+    '''
+    canonical = canonicalize(url)
+    scheme, _, rest = canonical.partition("://")
+    if not rest:
+        return canonical
+    if rest.startswith("www."):
+        rest = rest[4:]
+    path, question, query = rest.partition("?")
+    head, _, page = path.rpartition("/")
+    if head and page in index_pages:
+        path = head
+    return path.rstrip("/") + question + query
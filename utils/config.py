@@ -8,12 +8,100 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        # "threaded" runs THREADCOUNT Worker threads, "async" runs up to
+        # MAXINFLIGHT downloads on one asyncio event loop.
+        self.engine = config.get("LOCAL PROPERTIES", "ENGINE", fallback="threaded").strip()
+        self.max_in_flight = config.getint("LOCAL PROPERTIES", "MAXINFLIGHT", fallback=200)
+        # Processes that parse pages in parallel, 0 parses in the worker threads
+        self.parse_processes = config.getint("LOCAL PROPERTIES", "PARSEPROCESSES", fallback=0)
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        # Save file backend ("sqlite" or "shelve") and how often it is committed
+        self.save_backend = config.get("LOCAL PROPERTIES", "SAVEBACKEND", fallback="sqlite").strip()
+        self.save_batch_size = config.getint("LOCAL PROPERTIES", "SAVEBATCHSIZE", fallback=100)
+        self.save_flush_interval = config.getfloat("LOCAL PROPERTIES", "SAVEINTERVAL", fallback=5.0)
+        # Sizing of the in-memory Bloom filter of discovered urls
+        self.expected_urls = config.getint("LOCAL PROPERTIES", "EXPECTEDURLS", fallback=1000000)
+        self.bloom_false_positive_rate = config.getfloat("LOCAL PROPERTIES", "BLOOMFPRATE", fallback=0.01)
+        # Urls kept in memory by the frontier, the rest spill to disk in segments
+        self.max_queued_urls = config.getint("LOCAL PROPERTIES", "MAXQUEUEDURLS", fallback=100000)
+        self.spill_segment_size = config.getint("LOCAL PROPERTIES", "SPILLSEGMENTSIZE", fallback=10000)
+        # Directory of the compressed copy of every downloaded page (empty is off), see crawler/page_store.py
+        self.page_store = config.get("LOCAL PROPERTIES", "PAGESTORE", fallback="").strip()
+        self.page_store_compression = config.get("LOCAL PROPERTIES", "PAGESTORECOMPRESSION", fallback="gzip").strip()
+        self.page_store_segment_size = config.getint(
+            "LOCAL PROPERTIES", "PAGESTORESEGMENTSIZE", fallback=64) * 1024 * 1024
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        # Keep-alive connection pool to the cache server
+        self.download_pool_size = config.getint("CONNECTION", "POOLSIZE", fallback=max(10, self.threads_count))
+        self.download_connect_timeout = config.getfloat("CONNECTION", "CONNECTTIMEOUT", fallback=5.0)
+        self.download_read_timeout = config.getfloat("CONNECTION", "READTIMEOUT", fallback=30.0)
+        self.download_retries = config.getint("CONNECTION", "RETRIES", fallback=3)
+        self.download_backoff = config.getfloat("CONNECTION", "BACKOFF", fallback=0.5)
+        # Cache server responses above this size are dropped unread (0 for no limit)
+        self.download_max_bytes = config.getint("CONNECTION", "MAXRESPONSEKB", fallback=2048) * 1024
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        # Seconds before a cached robots.txt is downloaded again
+        self.robots_ttl = config.getfloat("CRAWLER", "ROBOTSTTL", fallback=86400.0)
+        # Pages whose SimHash differs in at most NEARDUPDISTANCE bits are near-duplicates
+        self.near_duplicate_distance = config.getint("CRAWLER", "NEARDUPDISTANCE", fallback=3)
+        self.max_fingerprints = config.getint("CRAWLER", "MAXFINGERPRINTS", fallback=500000)
+        # Url priority scorers, see crawler/scoring.py
+        self.url_scorers = config.get("CRAWLER", "SCORERS", fallback="")
+        # Crawler trap detection, see crawler/traps.py
+        self.trap_max_repeats = config.getint("CRAWLER", "TRAPMAXREPEATS", fallback=3)
+        self.trap_template_limit = config.getint("CRAWLER", "TRAPTEMPLATELIMIT", fallback=1000)
+        self.trap_throttle_every = config.getint("CRAWLER", "TRAPTHROTTLE", fallback=10)
+        self.trap_min_samples = config.getint("CRAWLER", "TRAPMINSAMPLES", fallback=20)
+        self.trap_low_yield_ratio = config.getfloat("CRAWLER", "TRAPLOWYIELD", fallback=0.8)
+        self.trap_min_words = config.getint("CRAWLER", "TRAPMINWORDS", fallback=50)
+        self.trap_max_templates = config.getint("CRAWLER", "TRAPMAXTEMPLATES", fallback=100000)
 
-        self.cache_server = None
\ No newline at end of file
+        # Crawl statistics checkpoints
+        self.stats_checkpoint_pages = config.getint("STATS", "CHECKPOINTPAGES", fallback=100)
+        self.stats_checkpoint_interval = config.getfloat("STATS", "CHECKPOINTINTERVAL", fallback=30.0)
+        self.stats_format = config.get("STATS", "FORMAT", fallback="json").strip()
+        self.stats_delta_log = config.getboolean("STATS", "DELTALOG", fallback=False)
+        # exact, or sketch for a fixed size approximate count of the most common words
+        self.stats_word_counts = config.get("STATS", "WORDCOUNTS", fallback="exact").strip()
+        self.stats_sketch_size = config.getint("STATS", "SKETCHSIZE", fallback=10000)
+
+        # Instrumentation, see utils/metrics.py
+        self.metrics_enabled = config.getboolean("METRICS", "ENABLED", fallback=False)
+        self.metrics_interval = config.getfloat("METRICS", "INTERVAL", fallback=60.0)
+        self.metrics_port = config.getint("METRICS", "PORT", fallback=0)
+        self.profile_interval = config.getfloat("METRICS", "PROFILEINTERVAL", fallback=0.0)
+
+        # Queued logging, see utils/log_queue.py
+        self.log_url_rate = config.getfloat("LOGGING", "URLSAMPLERATE", fallback=1.0)
+        self.log_flush_interval = config.getfloat("LOGGING", "FLUSHINTERVAL", fallback=1.0)
+
+        # Sharded crawling: this node crawls the hosts of shard i out of N, see crawler/sharding.py
+        self.shard_inbox = config.get("SHARDING", "INBOX", fallback="shards").strip()
+        self.shard_batch_size = config.getint("SHARDING", "BATCHSIZE", fallback=100)
+        self.shard_flush_interval = config.getfloat("SHARDING", "FLUSHINTERVAL", fallback=1.0)
+        self.shard_idle_timeout = config.getfloat("SHARDING", "IDLETIMEOUT", fallback=60.0)
+        self.unsharded_save_file = self.save_file
+        self.unsharded_page_store = self.page_store
+        self.set_shard(config.get("SHARDING", "SHARD", fallback="0/1"))
+
+        self.cache_server = None
+
+    def set_shard(self, shard):
+        # shard is "i/N". Every shard keeps its own save and stats files.
+        index, count = (int(part) for part in shard.split("/"))
+        assert 0 <= index < count, "Shard should be i/N with 0 <= i < N"
+        self.shard_index = index
+        self.shard_count = count
+        if count > 1:
+            self.save_file = f"{self.unsharded_save_file}.shard{index}"
+            if self.unsharded_page_store:
+                self.page_store = f"{self.unsharded_page_store}.shard{index}"
+            self.stats_prefix = f"stats_data.shard{index}"
+        else:
+            self.save_file = self.unsharded_save_file
+            self.page_store = self.unsharded_page_store
+            self.stats_prefix = "stats_data"
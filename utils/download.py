@@ -1,17 +1,143 @@
 import requests
 import cbor
 import time
+import random
+import asyncio
+
+from urllib.parse import urlencode
+
+from threading import Lock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from utils.response import Response
 
+
+class DownloadStats(object):
+    '''
+    Request latency counters shared by every download, with a uniform
+    random sample (reservoir) of at most sample_size latencies for the
+    percentiles.
+    '''
+    def __init__(self, sample_size=10000):
+        self.lock = Lock()
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.sample_size = sample_size
+        self.samples = list()
+        self.rng = random.Random(0)
+
+    def record(self, seconds, error=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            if len(self.samples) < self.sample_size:
+                self.samples.append(seconds)
+            else:
+                slot = self.rng.randrange(self.requests)
+                if slot < self.sample_size:
+                    self.samples[slot] = seconds
+
+    def percentile(self, percent):
+        with self.lock:
+            if not self.samples:
+                return 0.0
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    def summary(self):
+        with self.lock:
+            average = self.total_seconds / self.requests if self.requests else 0.0
+            summary = {
+                "requests": self.requests,
+                "errors": self.errors,
+                "average_seconds": average,
+                "max_seconds": self.max_seconds,
+            }
+        summary["p50_seconds"] = self.percentile(50)
+        summary["p99_seconds"] = self.percentile(99)
+        return summary
+
+download_stats = DownloadStats()
+
+# One keep-alive session per cache server, shared by all workers.
+_sessions = dict()
+_sessions_lock = Lock()
+
+def get_session(config):
+    with _sessions_lock:
+        session = _sessions.get(config.cache_server)
+        if session is None:
+            retries = Retry(
+                total=config.download_retries,
+                backoff_factor=config.download_backoff,
+                status_forcelist=(500, 502, 503, 504),
+                raise_on_status=False,
+                allowed_methods=("GET",))
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=config.download_pool_size,
+                max_retries=retries)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            _sessions[config.cache_server] = session
+        return session
+
+def _read_capped(resp, max_bytes):
+    # Body of a streamed response, or None as soon as it is known to be
+    # larger than max_bytes (from Content-Length, or while reading it).
+    if not max_bytes:
+        return resp.content
+    length = resp.headers.get("Content-Length", "")
+    if length.isdigit() and int(length) > max_bytes:
+        return None
+    chunks = list()
+    size = 0
+    for chunk in resp.iter_content(64 * 1024):
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def _too_large(url, config, logger):
+    logger.info(f"Response larger than {config.download_max_bytes} bytes with url {url}, skipped.")
+    return Response({
+        "error": f"Response larger than {config.download_max_bytes} bytes with url {url}.",
+        "status": 0,
+        "url": url})
+
 def download(url, config, logger=None):
     host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+    start = time.perf_counter()
+    try:
+        resp = get_session(config).get(
+            f"http://{host}:{port}/",
+            params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+            timeout=(config.download_connect_timeout, config.download_read_timeout),
+            stream=True)
+        try:
+            content = _read_capped(resp, config.download_max_bytes)
+        finally:
+            # Returns the connection to the pool, or drops it when the body was not read
+            resp.close()
+    except requests.RequestException as e:
+        # Keep the worker alive; the url is reported as failed instead.
+        download_stats.record(time.perf_counter() - start, error=True)
+        logger.error(f"Download error {e} with url {url}.")
+        return Response({
+            "error": f"Download error {e} with url {url}.",
+            "status": 0,
+            "url": url})
+    download_stats.record(time.perf_counter() - start)
+    if content is None:
+        return _too_large(url, config, logger)
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if resp and content:
+            return Response(cbor.loads(content))
     except (EOFError, ValueError) as e:
         pass
     logger.error(f"Spacetime Response error {resp} with url {url}.")
@@ -19,3 +145,164 @@ def download(url, config, logger=None):
         "error": f"Spacetime Response error {resp} with url {url}.",
         "status": resp.status_code,
         "url": url})
+
+class AsyncConnectionPool(object):
+    '''
+    Keep-alive HTTP/1.1 connections to the cache server for the asyncio
+    engine, like the requests session of get_session for the threads. A
+    connection goes back to the pool once its response was read to the end;
+    one the server asked to close, or whose body was too large to read, is
+    closed instead. At most max_idle connections wait in the pool.
+    '''
+    def __init__(self, host, port, max_idle):
+        self.loop = asyncio.get_running_loop()
+        self.host = host
+        self.port = port
+        self.max_idle = max_idle
+        self.idle = list()      # (reader, writer) ready for the next request
+        self.opened = 0
+
+    async def get(self, path, timeout, max_bytes=0):
+        # Returns the status code and the body, which is None when it is
+        # larger than max_bytes. Reading stops right there.
+        while self.idle:
+            reader, writer = self.idle.pop()
+            try:
+                return await self._request(reader, writer, path, timeout, max_bytes)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The server dropped the idle connection, the request is sent again
+                pass
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout[0])
+        self.opened += 1
+        return await self._request(reader, writer, path, timeout, max_bytes)
+
+    async def _request(self, reader, writer, path, timeout, max_bytes):
+        reusable = False
+        try:
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout[1])
+            status_line, _, header_lines = head.partition(b"\r\n")
+            version, status_code = status_line.split(b" ", 2)[:2]
+            status_code = int(status_code)
+            headers = dict()
+            for line in header_lines.split(b"\r\n"):
+                name, _, value = line.partition(b":")
+                headers[name.strip().lower()] = value.strip().lower()
+            connection = headers.get(b"connection", b"")
+            keep_alive = connection == b"keep-alive" or (version == b"HTTP/1.1" and connection != b"close")
+            length = headers.get(b"content-length", b"")
+            if headers.get(b"transfer-encoding", b"").endswith(b"chunked"):
+                body = await _read_chunked(reader, timeout[1], max_bytes)
+            elif length.isdigit():
+                if max_bytes and int(length) > max_bytes:
+                    return status_code, None
+                body = await _read_body(reader, int(length), timeout[1], max_bytes)
+            else:
+                # The body ends when the server closes the connection
+                keep_alive = False
+                body = await _read_body(reader, None, timeout[1], max_bytes)
+            reusable = keep_alive and body is not None
+            return status_code, body
+        finally:
+            if reusable and len(self.idle) < self.max_idle:
+                self.idle.append((reader, writer))
+            else:
+                writer.close()
+
+    def close(self):
+        for reader, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+async def _read_body(reader, length, timeout, max_bytes):
+    # length bytes, or everything up to the end of the stream when length is None
+    chunks = list()
+    size = 0
+    while length is None or size < length:
+        chunk = await asyncio.wait_for(
+            reader.read(64 * 1024 if length is None else min(64 * 1024, length - size)), timeout)
+        if not chunk:
+            if length is not None:
+                raise asyncio.IncompleteReadError(b"".join(chunks), length)
+            break
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+async def _read_chunked(reader, timeout, max_bytes):
+    chunks = list()
+    size = 0
+    while True:
+        size_line = await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout)
+        chunk_size = int(size_line.split(b";", 1)[0], 16)
+        if not chunk_size:
+            # Skip the trailer headers up to the empty line
+            while await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout) != b"\r\n":
+                pass
+            return b"".join(chunks)
+        size += chunk_size
+        if max_bytes and size > max_bytes:
+            return None
+        chunks.append(await asyncio.wait_for(reader.readexactly(chunk_size), timeout))
+        await asyncio.wait_for(reader.readexactly(2), timeout)
+
+# One connection pool per cache server, on the running event loop
+_async_pools = dict()
+
+def get_async_pool(config):
+    pool = _async_pools.get(config.cache_server)
+    if pool is None or pool.loop is not asyncio.get_running_loop():
+        host, port = config.cache_server
+        # Every download in flight keeps its connection for the next one
+        pool = AsyncConnectionPool(host, port, max(config.download_pool_size, config.max_in_flight))
+        _async_pools[config.cache_server] = pool
+    return pool
+
+def close_async_pool(config):
+    pool = _async_pools.pop(config.cache_server, None)
+    if pool is not None:
+        pool.close()
+
+async def download_async(url, config, logger=None, executor=None):
+    '''
+    Coroutine version of download for the asyncio engine. The cache server
+    response is decoded in executor (None is the loop's default executor),
+    off the event loop.
+    '''
+    pool = get_async_pool(config)
+    path = "/?" + urlencode([("q", f"{url}"), ("u", f"{config.user_agent}")])
+    timeout = (config.download_connect_timeout, config.download_read_timeout)
+    start = time.perf_counter()
+    for attempt in range(config.download_retries + 1):
+        try:
+            status_code, content = await pool.get(path, timeout, config.download_max_bytes)
+            if status_code < 500 or attempt == config.download_retries:
+                break
+        except (OSError, EOFError, asyncio.TimeoutError, asyncio.LimitOverrunError,
+                ValueError, IndexError) as e:
+            if attempt == config.download_retries:
+                download_stats.record(time.perf_counter() - start, error=True)
+                logger.error(f"Download error {e!r} with url {url}.")
+                return Response({
+                    "error": f"Download error {e!r} with url {url}.",
+                    "status": 0,
+                    "url": url})
+        await asyncio.sleep(config.download_backoff * (2 ** attempt))
+    download_stats.record(time.perf_counter() - start)
+    if content is None:
+        return _too_large(url, config, logger)
+    try:
+        if content:
+            resp_dict = await asyncio.get_running_loop().run_in_executor(executor, cbor.loads, content)
+            return Response(resp_dict)
+    except (EOFError, ValueError) as e:
+        pass
+    logger.error(f"Spacetime Response error <{status_code}> with url {url}.")
+    return Response({
+        "error": f"Spacetime Response error <{status_code}> with url {url}.",
+        "status": status_code,
+        "url": url})
@@ -0,0 +1,148 @@
+'''
+Logging for the crawler threads without blocking them on console or disk:
+every logger made by get_logger only puts its records on one queue, and a
+single background thread (a QueueListener) formats them, prints INFO and
+above to the console and appends everything to Logs/<file>.log. File writes
+go through large buffers that are flushed every flush interval, on every
+warning or error, and when the process exits.
+
+Per-url INFO lines (one per download) are sampled at the call site, before
+the message is even formatted:
+
+    if log_pipeline.sample_url():
+        logger.info(f"Downloaded {url}, status <{resp.status}>, ...")
+'''
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+
+from itertools import count
+from logging.handlers import QueueHandler, QueueListener
+
+log_directory = "Logs"
+log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class _FileQueueHandler(QueueHandler):
+    ''' Puts the records on the queue, tagged with the log file they go to. '''
+    def __init__(self, log_queue, log_file):
+        super().__init__(log_queue)
+        self.log_file = log_file
+
+    def prepare(self, record):
+        # Only this handler sees the record, so it is tagged instead of copied
+        # and the message is formatted by the listener thread.
+        record.log_file = self.log_file
+        return record
+
+
+class _BatchedFileHandler(logging.Handler):
+    ''' Appends the records to their log files, flushed every flush_interval seconds. '''
+    def __init__(self, flush_interval, buffer_size=64 * 1024):
+        super().__init__(logging.DEBUG)
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.files = dict()     # log file name -> open file
+        self.last_flush = time.monotonic()
+
+    def emit(self, record):
+        try:
+            log_file = self.files.get(record.log_file)
+            if log_file is None:
+                os.makedirs(log_directory, exist_ok=True)
+                log_file = self.files[record.log_file] = open(
+                    os.path.join(log_directory, f"{record.log_file}.log"), "a",
+                    encoding="utf-8", buffering=self.buffer_size)
+            log_file.write(self.format(record) + "\n")
+            if record.levelno >= logging.WARNING or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        for log_file in self.files.values():
+            log_file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        for log_file in self.files.values():
+            log_file.close()
+        self.files.clear()
+        super().close()
+
+
+class _BatchingListener(QueueListener):
+    ''' QueueListener that flushes the log files whenever the queue stays empty for a while. '''
+    def __init__(self, log_queue, file_handler, *handlers):
+        super().__init__(log_queue, file_handler, *handlers, respect_handler_level=True)
+        self.file_handler = file_handler
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, self.file_handler.flush_interval)
+            except queue.Empty:
+                self.file_handler.flush()
+
+
+class LogPipeline(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = queue.SimpleQueue()
+        self.listener = None
+        self.file_handler = None
+        self.loggers = dict()       # logger name -> logger, each set up once
+        self.flush_interval = 1.0
+        self.url_sample_every = 1
+        self.url_lines = count()
+        atexit.register(self.stop)
+
+    def configure(self, config):
+        # Sampling rate of the per-url lines and the flush interval of the log files
+        rate = min(max(config.log_url_rate, 0.0), 1.0)
+        self.url_sample_every = round(1 / rate) if rate > 0 else 0
+        self.flush_interval = config.log_flush_interval
+        if self.file_handler is not None:
+            self.file_handler.flush_interval = self.flush_interval
+
+    def _start(self):
+        formatter = logging.Formatter(log_format)
+        self.file_handler = _BatchedFileHandler(self.flush_interval)
+        self.file_handler.setFormatter(formatter)
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(formatter)
+        self.listener = _BatchingListener(self.queue, self.file_handler, console_handler)
+        self.listener.start()
+
+    def get_logger(self, name, filename=None):
+        with self.lock:
+            if self.listener is None:
+                self._start()
+            logger = self.loggers.get(name)
+            if logger is None:
+                logger = logging.getLogger(name)
+                logger.setLevel(logging.INFO)
+                logger.addHandler(_FileQueueHandler(self.queue, filename if filename else name))
+                self.loggers[name] = logger
+            return logger
+
+    def sample_url(self):
+        if self.url_sample_every == 1:
+            return True
+        return self.url_sample_every > 0 and next(self.url_lines) % self.url_sample_every == 0
+
+    def stop(self):
+        # Writes out everything still queued; get_logger starts a new listener after this.
+        with self.lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.file_handler.close()
+                self.listener = None
+
+
+log_pipeline = LogPipeline()
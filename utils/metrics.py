@@ -0,0 +1,264 @@
+'''
+Low overhead instrumentation of the crawl loop: per-stage timers with
+latency histograms, counters, gauges (read only when reported, e.g. the
+frontier queue depth) and per-host fetch counts. When enabled, the metrics
+are logged every interval seconds, can be served in Prometheus text format
+(and as JSON) on a local HTTP port, and an optional sampling profiler
+records which functions the threads are running.
+
+    with metrics.time("download"):
+        resp = download(url, config, logger)
+
+Disabled (the default), metrics.time returns a shared no-op context manager
+and the other calls return after one attribute check.
+'''
+import sys
+import json
+import time
+import bisect
+import threading
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils import get_logger, get_host
+
+# Upper bounds in seconds of the latency histogram buckets
+histogram_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_null_timer = _NullTimer()
+
+
+class _StageTimer(object):
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(object):
+    ''' Count, sum and bucket counts of the observed durations of one stage. '''
+    __slots__ = ("count", "total", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(histogram_buckets) + 1)   # Last bucket is +Inf
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect.bisect_left(histogram_buckets, seconds)] += 1
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket holding the quantile
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(histogram_buckets + (float("inf"),), self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class SamplingProfiler(object):
+    ''' Samples the innermost frames of every other thread every interval seconds. '''
+    def __init__(self, interval, depth=3):
+        self.interval = interval
+        self.depth = depth
+        self.samples = Counter()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, name="SamplingProfiler", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[" < ".join(stack)] += 1
+            time.sleep(self.interval)
+
+    def top(self, count=20):
+        total = sum(self.samples.values()) or 1
+        return [(stack, samples / total) for stack, samples in self.samples.most_common(count)]
+
+
+class Metrics(object):
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.histograms = dict()    # stage -> Histogram
+        self.counters = Counter()
+        self.gauges = dict()        # name -> function returning the current value
+        self.host_fetches = Counter()
+        self.last_host_fetches = Counter()
+        self.last_report = time.time()
+        self.interval = 60.0
+        self.server = None
+        self.profiler = None
+        self.logger = None
+
+    def configure(self, config):
+        self.enabled = config.metrics_enabled
+        if not self.enabled:
+            return
+        self.logger = get_logger("METRICS")
+        self.interval = config.metrics_interval
+        self.running = True
+        threading.Thread(target=self._report_loop, name="MetricsReporter", daemon=True).start()
+        if config.metrics_port:
+            self.server = ThreadingHTTPServer(("127.0.0.1", config.metrics_port), MetricsHandler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            self.logger.info(f"Serving metrics on http://127.0.0.1:{config.metrics_port}/metrics")
+        if config.profile_interval > 0:
+            self.profiler = SamplingProfiler(config.profile_interval)
+            self.profiler.start()
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.running = False
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+        if self.profiler is not None:
+            self.profiler.stop()
+        self.report()
+
+    def time(self, stage):
+        if not self.enabled:
+            return _null_timer
+        return _StageTimer(self, stage)
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += value
+
+    def count_fetch(self, url):
+        if self.enabled:
+            host = get_host(url)
+            with self.lock:
+                self.host_fetches[host] += 1
+
+    def gauge(self, name, function):
+        # function is only called when the metrics are reported.
+        self.gauges[name] = function
+
+    def snapshot(self, next_period=False):
+        # Host rates are per second since the last periodic report, which
+        # starts the next period when next_period is True.
+        now = time.time()
+        with self.lock:
+            elapsed = max(now - self.last_report, 1e-9)
+            host_rates = {host: (count - self.last_host_fetches[host]) / elapsed
+                          for host, count in self.host_fetches.items()}
+            if next_period:
+                self.last_host_fetches = Counter(self.host_fetches)
+                self.last_report = now
+            stages = {stage: {
+                "count": histogram.count,
+                "seconds": histogram.total,
+                "average_ms": 1000 * histogram.total / histogram.count if histogram.count else 0.0,
+                "p50_ms": 1000 * histogram.quantile(0.5),
+                "p99_ms": 1000 * histogram.quantile(0.99),
+            } for stage, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+        snapshot = {
+            "stages": stages,
+            "counters": counters,
+            "gauges": {name: function() for name, function in self.gauges.items()},
+            "top_host_fetches_per_second": dict(
+                sorted(host_rates.items(), key=lambda item: item[1], reverse=True)[:10]),
+        }
+        if self.profiler is not None:
+            snapshot["profile"] = self.profiler.top(10)
+        return snapshot
+
+    def report(self):
+        self.logger.info(json.dumps(self.snapshot(next_period=True), separators=(",", ":")))
+
+    def _report_loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            if self.running:
+                self.report()
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram_buckets + ("+Inf",), histogram.buckets):
+                    cumulative += count
+                    lines.append(f'crawler_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {histogram.total}')
+                lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"crawler_{name}_total {value}")
+            for host, count in sorted(self.host_fetches.items()):
+                lines.append(f'crawler_host_fetches_total{{host="{host}"}} {count}')
+        for name, function in sorted(self.gauges.items()):
+            lines.append(f"crawler_{name} {function()}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(metrics.snapshot(), indent=2).encode("utf-8")
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = metrics.prometheus_text().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+metrics = Metrics()
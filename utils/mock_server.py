@@ -0,0 +1,171 @@
+'''
+Local stand-in for the spacetime cache server, for testing and benchmarking
+the crawler without registering with the real one.
+
+    python -m utils.mock_server [--port 8000] [--latency 0.05] [--error_rate 0.01] [--corpus dir]
+    python3 launch.py --cache_server 127.0.0.1:8000
+
+It answers GET /?q=<url>&u=<user agent> like the cache server: a CBOR map with
+the url, the status and a pickled requests.Response, or an error message for
+the cache specific 6xx statuses. Pages come from a corpus directory of saved
+.html pages (served as https://www.ics.uci.edu/<file name>) or are generated:
+every host has site_size pages with text and links to other pages of the same
+and neighbouring hosts, the same for a given url on every run.
+'''
+import os
+import time
+import pickle
+import random
+import threading
+
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+
+
+class SyntheticSite(object):
+    ''' Deterministic pages for hosts host0.ics.uci.edu ... host<hosts - 1>.ics.uci.edu. '''
+    def __init__(self, hosts=10, site_size=100, words_per_page=300, links_per_page=10, vocabulary=5000):
+        self.hosts = hosts
+        self.site_size = site_size
+        self.words_per_page = words_per_page
+        self.links_per_page = links_per_page
+        rng = random.Random(0)
+        letters = "abcdefghijklmnopqrstuvwxyz"
+        self.vocabulary = ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10)))
+                           for _ in range(vocabulary)]
+        # Zipf-like word frequencies, like natural text
+        self.weights = [1 / (rank + 1) for rank in range(vocabulary)]
+
+    def seed_urls(self):
+        return [f"https://host{host}.ics.uci.edu/" for host in range(self.hosts)]
+
+    def page(self, url):
+        parsed = urlparse(url)
+        if not parsed.netloc.startswith("host"):
+            return None
+        host = parsed.netloc.split(".")[0]
+        rng = random.Random(url)
+        words = " ".join(rng.choices(self.vocabulary, self.weights, k=self.words_per_page))
+        links = []
+        for _ in range(self.links_per_page):
+            if rng.random() < 0.1:
+                # Link to another host
+                link_host = f"host{rng.randrange(self.hosts)}.ics.uci.edu"
+            else:
+                link_host = f"{host}.ics.uci.edu"
+            number = rng.randrange(self.site_size)
+            section = self.vocabulary[number % 20]
+            links.append(f'<a href="https://{link_host}/{section}/{number}">{section}</a>')
+        return (f"<html><head><title>{host}</title></head><body><p>{words}</p>"
+                f"{' '.join(links)}</body></html>").encode("utf-8")
+
+
+class CorpusSite(object):
+    ''' Saved .html pages from a directory, served as https://www.ics.uci.edu/<file name>. '''
+    def __init__(self, corpus_dir):
+        self.pages = dict()
+        for name in sorted(os.listdir(corpus_dir)):
+            if name.endswith(".html"):
+                with open(os.path.join(corpus_dir, name), "rb") as page_file:
+                    self.pages["/" + name] = page_file.read()
+
+    def seed_urls(self):
+        return ["https://www.ics.uci.edu" + path for path in list(self.pages)[:1]]
+
+    def page(self, url):
+        return self.pages.get(urlparse(url).path)
+
+
+class MockCacheServer(ThreadingHTTPServer):
+    '''
+    Serves a site with latency seconds of delay per request (uniformly
+    between half and one and a half times latency) and a fraction
+    error_rate of failed requests, split between 404, 500 and cache error
+    responses.
+    '''
+    daemon_threads = True
+
+    def __init__(self, site, port=0, latency=0.0, error_rate=0.0, seed=0):
+        super().__init__(("127.0.0.1", port), MockCacheHandler)
+        self.site = site
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def cache_server(self):
+        return self.server_address
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def respond(self, url):
+        with self.rng_lock:
+            self.requests += 1
+            delay = self.latency * (0.5 + self.rng.random())
+            error = self.rng.random() < self.error_rate
+            error_status = self.rng.choice((404, 500, 603))
+        if delay:
+            time.sleep(delay)
+        if error and error_status >= 600:
+            return {"url": url, "status": error_status, "error": f"Mock cache error for {url}."}
+
+        resp = requests.models.Response()
+        resp.url = url
+        resp.headers["Content-Type"] = "text/html; charset=utf-8"
+        content = None if url.endswith("/robots.txt") or error else self.site.page(url)
+        if content is None:
+            resp.status_code = error_status if error else 404
+            resp._content = b""
+        else:
+            resp.status_code = 200
+            resp._content = content
+        return {"url": url, "status": resp.status_code, "response": pickle.dumps(resp)}
+
+
+class MockCacheHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # Keep-alive, unless the client asks to close
+    # Headers and body are written separately, without this a keep-alive
+    # client waits for the delayed ACK on every response.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        if "q" not in query:
+            self.send_error(400)
+            return
+        body = cbor.dumps(self.server.respond(query["q"][0]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--corpus", type=str, default=None)
+    parser.add_argument("--hosts", type=int, default=10)
+    parser.add_argument("--site_size", type=int, default=100)
+    args = parser.parse_args()
+    site = CorpusSite(args.corpus) if args.corpus else SyntheticSite(args.hosts, args.site_size)
+    server = MockCacheServer(site, args.port, args.latency, args.error_rate)
+    print(f"Mock cache server on {server.cache_server[0]}:{server.cache_server[1]}, "
+          f"seed urls: {','.join(site.seed_urls())}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
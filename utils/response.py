@@ -1,14 +1,42 @@
 import pickle
 
 class Response(object):
+    '''
+    The url, status and error of a cache server response are read right
+    away. The pickled requests.Response is only unpickled the first time
+    raw_response is used, so pages thrown away because of their status are
+    never decoded.
+    '''
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        self._pickled = resp_dict["response"] if "response" in resp_dict else None
+        self._raw_response = None
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None:
+            pickled, self._pickled = self._pickled, None
+            try:
+                self._raw_response = pickle.loads(pickled)
+            except TypeError:
+                self._raw_response = None
+        return self._raw_response
+
+    @raw_response.setter
+    def raw_response(self, raw_response):
+        self._pickled = None
+        self._raw_response = raw_response
+
+    @property
+    def pickled_response(self):
+        # The pickled requests.Response as received, None once it was decoded
+        return self._pickled
+
+    @property
+    def body(self):
+        # Page bytes as a memoryview, without copying them
+        raw_response = self.raw_response
+        content = raw_response.content if raw_response is not None else None
+        return memoryview(content or b"")
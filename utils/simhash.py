@@ -0,0 +1,170 @@
+import os
+import time
+import struct
+import hashlib
+
+from array import array
+from collections import deque
+from functools import lru_cache
+from threading import Lock
+
+# Pages with fewer distinct words than this get no SimHash: with no words it
+# is 0 for every page, and with a handful it says nothing about the page, so
+# those pages are only compared by checksum.
+min_simhash_words = 3
+
+@lru_cache(maxsize=200000)
+def feature_hash(word):
+    # Stable 64-bit hash of a word (Python's hash() changes between runs)
+    return int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+
+def simhash(frequencies):
+    # 64-bit SimHash of a {word: count} dict, each word weighted by its count.
+    # Instead of updating 64 bit counters per word, the weights are summed per
+    # (byte position, byte value) and the bit sums are read from those tables.
+    byte_weights = [[0] * 256 for _ in range(8)]
+    total_weight = 0
+    for word, count in frequencies.items():
+        h = feature_hash(word)
+        total_weight += count
+        for position in range(8):
+            byte_weights[position][(h >> (8 * position)) & 0xff] += count
+    fingerprint = 0
+    for position in range(8):
+        weights = byte_weights[position]
+        for bit in range(8):
+            mask = 1 << bit
+            bit_weight = sum(weights[value] for value in range(256) if value & mask)
+            # The bit is set when the words with that bit set outweigh the others
+            if 2 * bit_weight > total_weight:
+                fingerprint |= 1 << (8 * position + bit)
+    return fingerprint
+
+def checksum(text_content):
+    # 64-bit checksum of the page text for exact duplicates
+    return int.from_bytes(hashlib.blake2b(text_content.encode("utf-8", "replace"), digest_size=8).digest(), "little")
+
+def fingerprints(text_content, frequencies):
+    # (checksum, simhash) of a page; the simhash is None for pages with too
+    # few distinct words to be compared as near-duplicates
+    if len(frequencies) < min_simhash_words:
+        return checksum(text_content), None
+    return checksum(text_content), simhash(frequencies)
+
+
+class DuplicateIndex(object):
+    '''
+    Exact checksum set plus a SimHash index for near-duplicate pages. The
+    64-bit fingerprints are split into max_distance + 1 bands, so any two
+    fingerprints within max_distance bits share at least one band exactly and
+    a lookup only compares against pages in the same band buckets. Pages
+    without a SimHash (too few words) are only checked for exact duplicates,
+    and are saved with 0 in place of the SimHash. At most
+    max_pages pages are kept (oldest evicted first), and the fingerprints are
+    saved next to the frontier save file every save_interval seconds (the
+    stats CHECKPOINTINTERVAL) while pages are added, and when the crawler stops.
+    '''
+    def __init__(self, config, restart, save_file=None):
+        self.max_distance = config.near_duplicate_distance
+        self.max_pages = config.max_fingerprints
+        self.save_file = save_file or config.save_file + ".fingerprints"
+        self.lock = Lock()
+        self.save_lock = Lock()
+        self.save_interval = config.stats_checkpoint_interval
+        self.last_save = time.time()
+        self.pages_since_save = 0
+
+        band_count = self.max_distance + 1
+        widths = [64 // band_count + (1 if i < 64 % band_count else 0) for i in range(band_count)]
+        self.bands = []     # (shift, mask) of each band
+        shift = 0
+        for width in widths:
+            self.bands.append((shift, (1 << width) - 1))
+            shift += width
+        self.band_buckets = [dict() for _ in self.bands]   # band value -> list of simhashes
+        self.checksums = set()
+        self.pages = deque()    # (checksum, simhash) in insertion order
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+        if restart and os.path.exists(self.save_file):
+            os.remove(self.save_file)
+        elif not restart:
+            self._load()
+
+    def _find_near(self, fingerprint):
+        for (shift, mask), buckets in zip(self.bands, self.band_buckets):
+            for other in buckets.get((fingerprint >> shift) & mask, ()):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                    return True
+        return False
+
+    def _add(self, page_checksum, fingerprint):
+        self.checksums.add(page_checksum)
+        self.pages.append((page_checksum, fingerprint))
+        if fingerprint is not None:
+            for (shift, mask), buckets in zip(self.bands, self.band_buckets):
+                buckets.setdefault((fingerprint >> shift) & mask, []).append(fingerprint)
+        if len(self.pages) > self.max_pages:
+            self._evict()
+
+    def _evict(self):
+        old_checksum, old_fingerprint = self.pages.popleft()
+        self.checksums.discard(old_checksum)
+        if old_fingerprint is None:
+            return
+        for (shift, mask), buckets in zip(self.bands, self.band_buckets):
+            key = (old_fingerprint >> shift) & mask
+            bucket = buckets[key]
+            bucket.remove(old_fingerprint)
+            if not bucket:
+                del buckets[key]
+
+    def is_duplicate(self, page_checksum, fingerprint):
+        ''' Returns True for a duplicate page, otherwise records the page and returns False. '''
+        with self.lock:
+            if page_checksum in self.checksums:
+                self.exact_duplicates += 1
+                return True
+            if fingerprint is not None and self._find_near(fingerprint):
+                self.near_duplicates += 1
+                return True
+            self._add(page_checksum, fingerprint)
+            self.pages_since_save += 1
+            save_due = time.time() - self.last_save >= self.save_interval
+        if save_due:
+            # A killed crawl loses at most save_interval seconds of pages
+            self.save(wait=False)
+        return False
+
+    def save(self, wait=True):
+        # Without wait, nothing is done while another thread is saving.
+        if not self.save_lock.acquire(blocking=wait):
+            return
+        try:
+            with self.lock:
+                self.last_save = time.time()
+                if not self.pages_since_save and os.path.exists(self.save_file):
+                    return
+                self.pages_since_save = 0
+                data = array("Q")
+                for page_checksum, fingerprint in self.pages:
+                    data.append(page_checksum)
+                    data.append(fingerprint if fingerprint is not None else 0)
+            tmp_file = self.save_file + ".tmp"
+            with open(tmp_file, "wb") as outfile:
+                outfile.write(struct.pack("Q", len(data) // 2))
+                outfile.write(data.tobytes())
+            os.replace(tmp_file, self.save_file)
+        finally:
+            self.save_lock.release()
+
+    def _load(self):
+        if not os.path.exists(self.save_file):
+            return
+        with open(self.save_file, "rb") as openFile:
+            count = struct.unpack("Q", openFile.read(8))[0]
+            data = array("Q")
+            data.frombytes(openFile.read(16 * count))
+        for i in range(0, len(data), 2):
+            self._add(data[i], data[i + 1] or None)
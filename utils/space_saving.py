@@ -0,0 +1,79 @@
+import heapq
+
+
+class SpaceSaving(object):
+    '''
+    Space-Saving heavy hitters sketch with at most capacity counters. A new
+    word that does not fit replaces the word with the smallest count and
+    inherits that count as its error. For a stream of total words:
+        count - error <= true count <= count
+        error <= total / capacity
+    so every word that occurs more than total / capacity times is tracked.
+    The smallest counter is found with a heap whose stale entries are fixed
+    lazily, so an update is O(log capacity) and memory is fixed.
+    '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = dict()  # word -> [count, error]
+        self.heap = list()      # (count, word), may hold an older count of the word
+        self.total = 0
+
+    def __len__(self):
+        return len(self.counters)
+
+    def __contains__(self, word):
+        return word in self.counters
+
+    def add(self, word, count=1):
+        # Returns whether the word was not tracked before.
+        self.total += count
+        counter = self.counters.get(word)
+        if counter is not None:
+            counter[0] += count
+            return False
+        if len(self.counters) < self.capacity:
+            self.counters[word] = [count, 0]
+            heapq.heappush(self.heap, (count, word))
+            return True
+        min_count, min_word = self._pop_min()
+        del self.counters[min_word]
+        self.counters[word] = [min_count + count, min_count]
+        heapq.heappush(self.heap, (min_count + count, word))
+        return True
+
+    def _pop_min(self):
+        # Every tracked word has exactly one heap entry, with its count or an older, smaller one.
+        while True:
+            count, word = heapq.heappop(self.heap)
+            current = self.counters[word][0]
+            if current == count:
+                return count, word
+            heapq.heappush(self.heap, (current, word))
+
+    def error_bound(self):
+        # Largest possible overestimate of any count
+        return self.total // self.capacity if len(self.counters) >= self.capacity else 0
+
+    def top(self, k):
+        # Returns the k (word, count, error) with the highest counts, O(capacity log k).
+        return [(word, count, error) for word, (count, error) in heapq.nlargest(
+            k, self.counters.items(), key=lambda item: item[1][0])]
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "total": self.total, "counters": self.counters}
+
+    @classmethod
+    def from_dict(cls, data, capacity=None):
+        sketch = cls(capacity or data["capacity"])
+        if sketch.capacity >= len(data["counters"]):
+            sketch.total = data["total"]
+            sketch.counters = {word: list(counter) for word, counter in data["counters"].items()}
+            sketch.heap = [(count, word) for word, (count, error) in sketch.counters.items()]
+            heapq.heapify(sketch.heap)
+        else:
+            # Smaller than the saved sketch: keep the largest counts
+            for word, (count, error) in sorted(data["counters"].items(), key=lambda item: item[1][0]):
+                sketch.add(word, count)
+                sketch.counters[word][1] += error
+            sketch.total = data["total"]
+        return sketch
@@ -0,0 +1,83 @@
+import re
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs
+
+
+class UrlFilter(object):
+    '''
+    The is_valid rules compiled once: a set lookup on the path extension, a
+    trie of reversed host labels for the allowed domains, one tuple
+    startswith for the avoided paths, and LRU caches of the verdicts per
+    url, per host, per path and per query, so repeated links and links that
+    share a host or path are decided by dictionary lookups.
+    '''
+    def __init__(self, valid_domains, paths_to_avoid, extensions,
+                 max_query_params=2, ignored_query_params=(), cache_size=65536):
+        self.domain_trie = dict()
+        for domain in valid_domains:
+            node = self.domain_trie
+            for label in reversed(domain.split(".")):
+                node = node.setdefault(label, dict())
+            node[None] = True   # A valid domain ends here
+        self.paths_to_avoid = tuple(paths_to_avoid)
+        self.extensions = frozenset(extensions)
+        self.extension_pattern = re.compile(r".*\.(" + "|".join(sorted(self.extensions)) + r")$")
+        self.max_query_params = max_query_params
+        self.ignored_query_params = tuple(ignored_query_params)
+
+        self.valid_host = lru_cache(maxsize=cache_size)(self._valid_host)
+        self.valid_path = lru_cache(maxsize=cache_size)(self._valid_path)
+        self.valid_query = lru_cache(maxsize=cache_size)(self._valid_query)
+        # Most links on a page are repeats of links already seen (nav bars, footers)
+        self.is_valid = lru_cache(maxsize=cache_size)(self._is_valid)
+
+    def _valid_host(self, netloc):
+        # Same as: domain == d or domain.endswith("." + d) for a valid domain d
+        domain = netloc.replace("www.", "")
+        node = self.domain_trie
+        for label in reversed(domain.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+    def _valid_path(self, path):
+        # Avoid crawler traps and low information paths
+        if path.strip("/").startswith(self.paths_to_avoid):
+            return False
+        # Avoid instructor/course links (path starts with ~)
+        if path.startswith("/~"):
+            return False
+        # Filter out non-webpage extensions
+        lower_path = path.lower()
+        if "\n" in lower_path:
+            return not self.extension_pattern.match(lower_path)
+        return lower_path.rpartition(".")[2] not in self.extensions or "." not in lower_path
+
+    def _valid_query(self, query):
+        if not query:
+            return True
+        query_params = parse_qs(query)
+        # Ignore links with too many query parameters
+        if len(query_params) > self.max_query_params:
+            return False
+        # Ignore links with filtering or ordering related queries
+        for param in query_params.keys():
+            if param.startswith(self.ignored_query_params):
+                return False
+        return True
+
+    def _is_valid(self, url):
+        parsed = urlparse(url)
+        # Check valid scheme
+        if parsed.scheme not in ("http", "https"):
+            return False
+        return (self.valid_host(parsed.netloc)
+                and self.valid_path(parsed.path)
+                and self.valid_query(parsed.query))
+
+    def filter_urls(self, urls):
+        is_valid = self.is_valid
+        return [url for url in urls if is_valid(url)]